@@ -1,3 +1,4 @@
+import argparse
 import logging
 import sys
 import pyfiglet
@@ -6,12 +7,25 @@ import pytz
 from discord.ext import commands
 
 import constants
+from modules import utility
 
 LOG_FORMAT = '%(levelname)s [%(asctime)s]: %(message)s'
 logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
 
 logging.info('[RSVP Bot] Starting WoW RSVP Bot')
 
+if utility.missing_settings:
+    # Constants file copied from an older example
+    logging.warning(f'[RSVP Bot] Settings missing from constants.py, using their defaults: {", ".join(utility.missing_settings)}')
+    logging.warning('Copy them from constants.py.example into constants.py to change them')
+
+parser = argparse.ArgumentParser(description='WoW RSVP Bot')
+parser.add_argument('--shard-count', type=int, default=constants.SHARD_COUNT, help='Total number of shards across all bot processes')
+parser.add_argument('--shards', default=constants.SHARD_IDS, help='Shard ids run by this process, as a range (i.e. 0-3) or a comma separated list (i.e. 0,2,4)')
+parser.add_argument('--socket', default=constants.SCHEDULER_SOCKET, help='Socket path the scheduler worker connects to, when SCHEDULER_WORKER is enabled')
+args = parser.parse_args()
+constants.SCHEDULER_SOCKET = args.socket
+
 # Startup checks
 logging.debug('[RSVP Bot] Running pre-flight')
 if not constants.DISCORD_TOKEN or constants.DISCORD_TOKEN == 'inserttokenhere':
@@ -34,7 +48,37 @@ for x, y in constants.TIMEZONE_ALIASES.items():
         logging.fatal('Ensure this TZ data is correct. Timezones are case-sensitive')
         sys.exit(1)
 
-BOT = commands.Bot(command_prefix=constants.DISCORD_PREFIX)
+try:
+    shard_ids = utility.parse_shard_ids(args.shards)
+
+except ValueError:
+    logging.fatal(f'[RSVP Bot] Shard ids "{args.shards}" are invalid')
+    logging.fatal('Provide a range (i.e. 0-3) or a comma separated list (i.e. 0,2,4)')
+    sys.exit(1)
+
+if shard_ids is not None:
+    if not args.shard_count:
+        # Shard ids without a total to partition guilds by
+        logging.fatal('[RSVP Bot] Shard ids are set without a shard count')
+        logging.fatal('Set SHARD_COUNT in constants.py or pass --shard-count and run again')
+        sys.exit(1)
+
+    for x in shard_ids:
+        if not 0 <= x < args.shard_count:
+            logging.fatal(f'[RSVP Bot] Shard id {x} is out of range for a shard count of {args.shard_count}')
+            sys.exit(1)
+
+if (shard_ids is not None or constants.SCHEDULER_WORKER) and not constants.STORAGE_PARTITIONED:
+    # Every process would be taking turns on the single shared database file
+    logging.warning('[RSVP Bot] Multiple processes are sharing the tinydb folder without partitioned storage')
+    logging.warning('Set STORAGE_PARTITIONED = True in constants.py so each server has its own database file')
+
+if constants.SHARDING or args.shard_count or shard_ids is not None:
+    logging.info(f'[RSVP Bot] Sharding enabled. Shard count: {args.shard_count or "automatic"} | Shards: {"all" if shard_ids is None else shard_ids}')
+    BOT = commands.AutoShardedBot(command_prefix=constants.DISCORD_PREFIX, shard_count=args.shard_count, shard_ids=shard_ids)
+
+else:
+    BOT = commands.Bot(command_prefix=constants.DISCORD_PREFIX)
 
 class RSVPBot(commands.Cog):
     def __init__(self, bot):
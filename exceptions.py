@@ -21,3 +21,6 @@ class InvalidDOW(RSVPException):
 
 class NotFound(RSVPException):
     pass
+
+class IPCError(RSVPException):
+    pass
@@ -0,0 +1,163 @@
+import asyncio
+import functools
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+
+import pendulum
+
+from modules import utility
+
+HEARTBEAT = 0.1 # Seconds between event loop heartbeats
+
+watchdog = None
+
+class Watchdog:
+    """
+    Measures event loop lag with a heartbeat task and samples the loop thread's stack from a
+    separate thread whenever the heartbeat stalls past the threshold.
+    """
+    def __init__(self, loop, threshold, top=10):
+        self.loop = loop
+        self.threshold = threshold
+        self.top = top
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.beats = 0
+        self.last_beat = time.monotonic()
+        self.stalls = []
+        self.timings = {}
+        self.slowest = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = loop.create_task(self._beat())
+        self._sampler = threading.Thread(target=self._sample, name='RSVP Bot lag watchdog', daemon=True)
+        self._sampler.start()
+
+    def close(self):
+        self._closed.set()
+        self._heartbeat.cancel()
+
+    async def _beat(self):
+        while True:
+            start = time.monotonic()
+            self.last_beat = start
+            self.beats += 1
+            await asyncio.sleep(HEARTBEAT)
+            self.lag = max(time.monotonic() - start - HEARTBEAT, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+
+    def _sample(self):
+        episode = None
+        while not self._closed.wait(self.threshold / 2):
+            beats = self.beats
+            held = time.monotonic() - self.last_beat - HEARTBEAT
+            if held < self.threshold:
+                continue
+
+            if episode and episode['beats'] == beats:
+                # Same stall as last sample, only extend its duration
+                with self._lock:
+                    episode['held'] = held
+
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if not frame:
+                continue
+
+            stack = traceback.format_stack(frame)
+            coroutine = None
+            while frame:
+                if frame.f_code.co_flags & inspect.CO_COROUTINE:
+                    coroutine = f'{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})'
+                    break
+
+                frame = frame.f_back
+
+            episode = {
+                'beats': beats,
+                'held': held,
+                'coroutine': coroutine or 'unknown',
+                'stack': stack,
+                'when': pendulum.now('UTC')
+            }
+            with self._lock:
+                self.stalls.append(episode)
+                self.stalls.sort(key=lambda x: x['held'], reverse=True)
+                del self.stalls[self.top:]
+
+            logging.warning(f'[Diagnostics] Event loop held for over {held:.2f}s by {episode["coroutine"]}. Stack:\n{"".join(stack)}')
+
+    def record(self, name, duration):
+        stats = self.timings.setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0})
+        stats['calls'] += 1
+        stats['total'] += duration
+        stats['max'] = max(stats['max'], duration)
+
+        self.slowest.append((duration, name, pendulum.now('UTC')))
+        self.slowest.sort(key=lambda x: x[0], reverse=True)
+        del self.slowest[self.top:]
+
+    def summary(self):
+        """
+        Return a plain text report of loop lag, the worst stalls and the slowest handlers and ticks.
+        """
+        lines = [f'Event loop lag: {self.lag * 1000:.0f}ms now, {self.max_lag * 1000:.0f}ms max (threshold {self.threshold * 1000:.0f}ms)', '']
+        with self._lock:
+            stalls = list(self.stalls)
+
+        lines.append(f'Longest loop stalls (top {self.top}):')
+        if not stalls:
+            lines.append('  None recorded')
+
+        for stall in stalls:
+            lines.append(f'  {stall["held"]:.2f}s in {stall["coroutine"]} at {stall["when"].format("MMM Do HH:mm:ss")} UTC')
+
+        lines.append('')
+        lines.append(f'Slowest handlers and ticks (top {self.top}):')
+        if not self.slowest:
+            lines.append('  None recorded')
+
+        for duration, name, when in self.slowest:
+            stats = self.timings[name]
+            lines.append(f'  {duration * 1000:.0f}ms {name} at {when.format("MMM Do HH:mm:ss")} UTC ' \
+                         f'(avg {stats["total"] / stats["calls"] * 1000:.0f}ms over {stats["calls"]} call{utility.plural(stats["calls"])})')
+
+        return '\n'.join(lines)
+
+def start(loop, threshold, top):
+    global watchdog
+    if not watchdog:
+        watchdog = Watchdog(loop, threshold, top)
+        logging.info(f'[Diagnostics] Event loop watchdog started with a {threshold}s threshold')
+
+    return watchdog
+
+def stop():
+    global watchdog
+    if watchdog:
+        watchdog.close()
+        watchdog = None
+
+def timed(func):
+    """
+    Decorator recording the duration of a coroutine when diagnostics are enabled.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not watchdog:
+            return await func(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+
+        finally:
+            if watchdog: watchdog.record(func.__qualname__, time.perf_counter() - start)
+
+    return wrapper
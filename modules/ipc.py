@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+
+import exceptions
+
+RECONNECT_DELAY = 5 # Seconds between connection attempts
+
+async def serve(path, handler):
+    """
+    Serve newline delimited JSON requests on a unix socket. Each request body is passed to the handler
+    coroutine in its own task, and a reply is written once it finishes. Clients wanting requests handled
+    in order must wait for each reply before sending the next.
+    """
+    async def handle(request, writer, write_lock):
+        reply = {'id': request['id'], 'ok': True}
+        try:
+            await handler(request['body'])
+
+        except Exception as e:
+            logging.exception(f'[IPC] Failed to execute {request["body"].get("action")} action {request["body"].get("key")}')
+            reply = {'id': request['id'], 'ok': False, 'error': repr(e)}
+
+        async with write_lock:
+            writer.write((json.dumps(reply) + '\n').encode())
+            await writer.drain()
+
+    async def connected(reader, writer):
+        logging.info('[IPC] Scheduler worker connected')
+        write_lock = asyncio.Lock()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            asyncio.ensure_future(handle(json.loads(line), writer, write_lock))
+
+        logging.info('[IPC] Scheduler worker disconnected')
+        writer.close()
+
+    if os.path.exists(path):
+        os.remove(path) # Stale socket from a previous run
+
+    return await asyncio.start_unix_server(connected, path=path)
+
+class Client:
+    """
+    Sends requests to a server started by serve, reconnecting as needed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pending = {}
+        self.writer = None
+        self._ids = itertools.count()
+        self._connecting = asyncio.Lock()
+
+    async def connect(self):
+        async with self._connecting:
+            while not self.writer:
+                try:
+                    reader, self.writer = await asyncio.open_unix_connection(self.path)
+
+                except (FileNotFoundError, ConnectionRefusedError):
+                    logging.warning(f'[IPC] Unable to connect to the bot at {self.path}, retrying in {RECONNECT_DELAY} seconds')
+                    await asyncio.sleep(RECONNECT_DELAY)
+                    continue
+
+                logging.info(f'[IPC] Connected to the bot at {self.path}')
+                self.pending = {} # Requests sent on this connection
+                asyncio.ensure_future(self._read(reader, self.writer, self.pending))
+
+    async def _read(self, reader, writer, pending):
+        while True:
+            try:
+                line = await reader.readline()
+
+            except OSError: # Reset by the bot
+                break
+
+            if not line:
+                break
+
+            reply = json.loads(line)
+            future = pending.pop(reply['id'], None)
+            if not future or future.done():
+                continue
+
+            if reply['ok']:
+                future.set_result(True)
+
+            else:
+                future.set_exception(exceptions.IPCError(reply['error']))
+
+        if self.writer is writer: # Not already replaced after a failed write
+            logging.warning('[IPC] Connection to the bot was lost')
+            self.writer = None
+
+        for future in pending.values():
+            if not future.done(): future.set_exception(exceptions.IPCError('Connection lost'))
+
+        pending.clear()
+
+    async def request(self, body):
+        """
+        Send a request and wait for the server to finish handling it.
+        """
+        await self.connect()
+        _id = next(self._ids)
+        future = asyncio.get_event_loop().create_future()
+        writer, pending = self.writer, self.pending
+        pending[_id] = future
+        try:
+            writer.write((json.dumps({'id': _id, 'body': body}) + '\n').encode())
+            await writer.drain()
+
+        except OSError as e:
+            # The bot dropped the connection, i.e. while restarting, before it was seen closing
+            pending.pop(_id, None)
+            if self.writer is writer:
+                logging.warning('[IPC] Connection to the bot was lost')
+                self.writer = None
+                writer.close()
+
+            raise exceptions.IPCError(f'Connection lost: {e}')
+
+        return await future
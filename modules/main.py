@@ -1,114 +1,187 @@
 import asyncio
+import functools
+import io
+import itertools
 import logging
+import os
 import re
+import tempfile
+import time
 import typing
 
 import pendulum
 import discord
 from discord.ext import commands, tasks
-from tinymongo import TinyMongoClient
 
 import constants
 import exceptions
-from modules import utility
+from modules import diagnostics, ipc, outbound, outbox, scheduler, stats, storage, transfer, utility
 
-mclient = TinyMongoClient('tinydb')
+mclient = storage.mclient
+
+LIST_PAGE_SIZE = 10
+BULK_LIMIT = 25
+BULK_CONCURRENCY = 3
+LIST_EMOJI = ['⬅️', '➡️']
+
+async def _handle_request(bot, body):
+    """
+    Dispatch a batch sent by the scheduler worker to the current Background cog, so the server outlives a reload.
+    """
+    await bot.get_cog('Background').dispatch(body['actions'])
 
 class Background(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, sender, handoff):
         self.bot = bot
-        self._rsvp_triggers.start() #pylint: disable=no-member
+        self.sender = sender
+        self.handoff = handoff
+        self.ipc_server = handoff.get('ipc_server')
+        self.caught_up = handoff.get('caught_up') or asyncio.Event()
+        self.delivering = handoff.get('delivering', set()) # Outbox keys with a delivery in progress
+        if constants.SCHEDULER_WORKER:
+            # Scheduling runs in modules.worker, which sends due actions here to be executed
+            if not self.ipc_server:
+                self.ipc_server = bot.loop.create_task(ipc.serve(constants.SCHEDULER_SOCKET, functools.partial(_handle_request, bot)))
+
+        else:
+            self._rsvp_triggers.start() #pylint: disable=no-member
 
     def cog_unload(self):
         self._rsvp_triggers.stop() #pylint: disable=no-member
+        if self.bot.rsvp_handoff is not None:
+            # Reloading, the new cog takes over once the last tick has finished
+            self.bot.rsvp_handoff.update({
+                'rsvp_triggers': self._rsvp_triggers.get_task(), #pylint: disable=no-member
+                'ipc_server': self.ipc_server,
+                'caught_up': self.caught_up,
+                'delivering': self.delivering
+            })
+            return
+
+        if self.ipc_server:
+            if self.ipc_server.done() and not self.ipc_server.exception():
+                self.ipc_server.result().close()
+
+            else:
+                self.ipc_server.cancel()
 
     @tasks.loop(minutes=1)
+    @diagnostics.timed
     async def _rsvp_triggers(self):
-        reservations = mclient.rsvpbot.reservations.find({'active': True})
-        for rsvp in reservations:
-            config = mclient.rsvpbot.config.find_one({'_id': rsvp['guild']})
-            start_date = pendulum.from_timestamp(rsvp['date'], tz=utility.timezone_alias(rsvp['timezone']))
-            current_date = pendulum.now(utility.timezone_alias(rsvp['timezone']))
-
-            date_diff = start_date - current_date
-            human_diff = current_date.add(seconds=date_diff.in_seconds()).diff_for_humans()
-            if date_diff.in_seconds() <= 7200 and not rsvp['admin_reminder']: # 2 hours prior, and first notification
-                participant_count = len(rsvp["participants"])
-                tanks = 0
-                healers = 0
-                dps = 0
-
-                for user in rsvp['participants']:
-                    if user['role'] == 'tank':
-                        tanks += 1
-
-                    elif user['role'] == 'healer':
-                        healers += 1
-
-                    elif user['role'] == 'dps':
-                        dps += 1
-
-                if tanks < constants.TANK_COUNT or healers < constants.HEALER_COUNT or dps < constants.DPS_COUNT or participant_count < constants.TOTAL_COUNT:
-                    alert_roles = []
-                    for x in config['access_roles']:
-                        alert_roles.append(f'<@&{x}>')
-
-                    role_mentions = ' '.join(alert_roles)
-                    admin_channel = self.bot.get_channel(config['admin_channel'])
-
-
-                    try:
-                        await admin_channel.send(f'{role_mentions} Raid event notification: scheduled raid {human_diff} has less members than minimum threshold for an event.\n' \
-                                                 f':man_raising_hand: **{participant_count}** user{utility.plural(participant_count)} {"is" if participant_count == 1 else "are"} signed up. Of these there are ' \
-                                                 f'**{tanks}** {constants.EMOJI_TANK}tank{utility.plural(tanks)}, **{healers}** {constants.EMOJI_HEALER}healer{utility.plural(healers)}, and **{dps}** {constants.EMOJI_DPS}dps.')
-
-                    except discord.Forbidden:
-                        if admin_channel:
-                            logging.error(f'[RSVP Bot] Unable to send low player count alert to admins. Guild ({admin_channel.guild}) | Channel ({admin_channel.channel}), aborted')
-
-                    mclient.rsvpbot.reservations.update_one({'_id': rsvp['_id']}, {'$set': {
-                        'admin_reminder': True
-                    }})
-
-            if date_diff.in_seconds() <= 900 and not rsvp['user_reminder']: # 15 minutes prior, and first notification
-                rsvp_channel = self.bot.get_channel(config['rsvp_channel'])
-                users = [f'<@!{u["user"]}>' for u in rsvp['participants']]
-                await rsvp_channel.send(f':bellhop: Event starting soon! {mclient.rsvpbot.config.find_one({"_id": rsvp["guild"]})["invite_message"]}\n\n{", ".join(users)}')
-
-                mclient.rsvpbot.reservations.update_one({'_id': rsvp['_id']}, {'$set': {
-                    'user_reminder': True
-                }})
-
-            if date_diff.in_seconds() <= 0:
-                try:
-                    rsvp_message = await self.bot.get_channel(rsvp['channel']).fetch_message(rsvp['_id'])
+        await self.dispatch(await storage.run(list, scheduler.due_reservations(functools.partial(utility.local_guild, self.bot)), lane='scan'))
 
-                except (discord.NotFound, discord.Forbidden, AttributeError) as e:
-                    logging.error(f'[Main] Unable to edit reservation message after it has started. Error from Discord: {e}')
-                    mclient.rsvpbot.reservations.update_one({'_id': rsvp['_id']}, {
-                        '$set': {
-                            'active': False
-                        }
-                    })
-                    continue
+    @_rsvp_triggers.before_loop
+    async def _catch_up(self):
+        """
+        Recover from downtime before the first tick by executing every missed action in one pass, a few reservations at a time.
+        After a reload there is no downtime to recover from. The previous cog's loop stops at its next deadline instead,
+        and the first tick here runs in its place.
+        """
+        previous = self.handoff.get('rsvp_triggers')
+        if previous:
+            await asyncio.wait([previous])
 
-                mclient.rsvpbot.reservations.update_one({'_id': rsvp['_id']}, {
-                    '$set': {
-                        'active': False
-                    }
-                })
+        else:
+            local = functools.partial(utility.local_guild, self.bot)
+            actions = await storage.run(list, scheduler.due_reservations(local), lane='scan') + await storage.run(list, scheduler.due_recurring(local), lane='scan')
+            if actions:
+                logging.info(f'[Background] Catching up on {len(actions)} missed action(s)')
+
+            await self.dispatch(actions)
+
+        self.caught_up.set()
+
+    async def dispatch(self, actions):
+        """
+        Execute a batch of actions planned by the scheduler. Notify, remind and lock actions are stored in the outbox
+        and their reservation flags committed together before anything is sent, then every entry in the outbox is
+        delivered, including ones left over from an earlier failure or restart. Returns a list of (action, exception)
+        for actions that failed. Deliveries that keep failing are retried until their outbox retry window has passed.
+        """
+        fresh = set(await storage.run_each(outbox.enqueue, [x for x in actions if x['action'] != 'post']))
+        posts = [x for x in actions if x['action'] == 'post']
+        failures = [] if not posts else await scheduler.run_grouped(posts, self.bot.get_cog('RSVP Bot').post_recurring, constants.CATCHUP_CONCURRENCY)
+
+        entries = [x for x in await storage.run(outbox.pending, functools.partial(utility.local_guild, self.bot), lane='scan') if x['_id'] not in self.delivering]
+        self.delivering.update(x['_id'] for x in entries)
+        try:
+            undelivered = await scheduler.run_grouped([x['action'] for x in entries], functools.partial(self._deliver, fresh), constants.CATCHUP_CONCURRENCY)
+            failed = set(x[0]['key'] for x in undelivered)
+            dropped = set(x['_id'] for x in await storage.run_each(outbox.finish, entries, failed))
+
+        finally:
+            self.delivering.difference_update(x['_id'] for x in entries)
+
+        failures += undelivered
+        for action, e in failures:
+            if action['key'] in dropped:
+                logging.error(f'[Background] {action["action"].capitalize()} action {action["key"]} failed past its retry window and has been dropped: {e}')
+
+            else:
+                logging.error(f'[Background] {action["action"].capitalize()} action {action["key"]} failed and will be retried: {e}')
+
+        return failures
 
-                embed = rsvp_message.embeds[0]
+    async def _already_sent(self, channel, action):
+        """
+        Check whether a notification was sent by an earlier delivery attempt that was interrupted before it was recorded.
+        """
+        try:
+            async for message in channel.history(limit=outbox.HISTORY_LIMIT):
+                if message.author.id == self.bot.user.id and message.content == action['content']:
+                    return True
+
+        except discord.Forbidden:
+            pass
+
+        return False
+
+    async def _deliver(self, fresh, action):
+        """
+        Deliver an outbox entry. Entries not stored by the current batch may have been sent before a restart, so recent
+        channel history is checked before sending them again. Returning without raising removes the entry from the outbox.
+        """
+        if action['action'] == 'notify':
+            admin_channel = self.bot.get_channel(action['channel'])
+            try:
+                if action['key'] in fresh or not await self._already_sent(admin_channel, action):
+                    await self.sender.submit(admin_channel.id, outbound.MESSAGES, outbound.REMINDER, admin_channel.send, action['content'])
+
+            except (discord.Forbidden, AttributeError):
+                logging.error(f'[RSVP Bot] Unable to send low player count alert to admins. Guild ({action["guild"]}) | Channel ({action["channel"]}), aborted')
+
+        elif action['action'] == 'remind':
+            rsvp_channel = self.bot.get_channel(action['channel'])
+            try:
+                if action['key'] in fresh or not await self._already_sent(rsvp_channel, action):
+                    await self.sender.submit(rsvp_channel.id, outbound.MESSAGES, outbound.REMINDER, rsvp_channel.send, action['content'])
+
+            except (discord.Forbidden, AttributeError):
+                logging.error(f'[RSVP Bot] Unable to send event reminder. Guild ({action["guild"]}) | Channel ({action["channel"]}), aborted')
+
+        elif action['action'] == 'lock':
+            try:
+                rsvp_message = await self.bot.get_channel(action['channel']).fetch_message(action['rsvp'])
+
+            except (discord.NotFound, discord.Forbidden, AttributeError) as e:
+                logging.error(f'[Main] Unable to edit reservation message after it has started. Error from Discord: {e}')
+                return
+
+            self.sender.discard(rsvp_message.id)
+            embed = rsvp_message.embeds[0]
+            if not embed.title.startswith('[Locked]'): # Not already edited before a restart
                 embed.color = 0x378092
                 embed.title = '[Locked] ' + embed.title
                 embed.remove_field(3) # How-to-signup field
+                await self.sender.submit(rsvp_message.channel.id, outbound.MESSAGES, outbound.EDIT, rsvp_message.edit, embed=embed)
 
-                await rsvp_message.edit(embed=embed)
-                await rsvp_message.clear_reactions()
+            await self.sender.submit(rsvp_message.channel.id, outbound.REACTIONS, outbound.EDIT, rsvp_message.clear_reactions)
 
 class Main(commands.Cog, name='RSVP Bot'):
-    def __init__(self, bot):
+    def __init__(self, bot, sender, handoff):
         self.bot = bot
+        self.sender = sender
+        self.handoff = handoff
         self.READY = False
         self.REACT_EMOJI = [
             constants.EMOJI_TANK,
@@ -128,33 +201,73 @@ class Main(commands.Cog, name='RSVP Bot'):
             constants.EMOJI_LEADER: 'host',
             constants.EMOJI_CONFIRMED: 'confirmed'
         }
-        self._recurring_event_trigger.start() #pylint: disable=no-member
+        if not constants.SCHEDULER_WORKER:
+            self._recurring_event_trigger.start() #pylint: disable=no-member
 
     def cog_unload(self):
         self._recurring_event_trigger.stop() #pylint: disable=no-member
+        if self.bot.rsvp_handoff is not None:
+            # Reloading, the new cog takes over the sender with its queued messages and the diagnostics watchdog
+            self.bot.rsvp_handoff.update({
+                'recurring_event_trigger': self._recurring_event_trigger.get_task(), #pylint: disable=no-member
+                'sender': self.sender
+            })
+            return
+
+        self.sender.close()
+        diagnostics.stop()
+
+    async def cog_before_invoke(self, ctx):
+        ctx.invoked_at = time.perf_counter()
+        ctx.waited = 0.0
+
+    async def cog_after_invoke(self, ctx):
+        if diagnostics.watchdog:
+            diagnostics.watchdog.record(ctx.command.qualified_name, time.perf_counter() - ctx.invoked_at - ctx.waited)
+
+    async def wait_for_user(self, ctx, event, **kwargs):
+        """
+        Wait for a reply or reaction from the command's author. Time spent waiting is left out of the command's timing in diagnostics.
+        """
+        start = time.perf_counter()
+        try:
+            return await self.bot.wait_for(event, **kwargs)
+
+        finally:
+            ctx.waited = getattr(ctx, 'waited', 0.0) + time.perf_counter() - start
 
     @tasks.loop(seconds=10)
+    @diagnostics.timed
     async def _recurring_event_trigger(self):
-        db = mclient.rsvpbot.recurring
-        for rule in db.find({}):
-            if pendulum.now(tz=utility.timezone_alias(rule['timezone'])).int_timestamp >= rule['next_run']: # Up for event posting
-                if rule['freq'] == 'daily':
-                    await self._create_reservation(day=rule['next_run'] + (60 * 60 * 24), tz=utility.timezone_alias(rule['timezone']), desc=rule['description'], recurr=rule)
-                    db.update_one({'_id': rule['_id']}, {'$set': {
-                        'next_run': rule['next_run'] + (60 * 60 * 24)
-                    }})
-
-                elif rule['freq'] == 'weekly':
-                    await self._create_reservation(day=rule['next_run'] + (60 * 60 * 24 * 7), tz=utility.timezone_alias(rule['timezone']), desc=rule['description'], recurr=rule)
-                    db.update_one({'_id': rule['_id']}, {'$set': {
-                        'next_run': rule['next_run'] + (60 * 60 * 24 * 7)
-                    }})
-
-                else: # biweekly - run every 2 weeks, making a rsvp the next week
-                    await self._create_reservation(day=rule['next_run'] + (60 * 60 * 24 * 7), tz=utility.timezone_alias(rule['timezone']), desc=rule['description'], recurr=rule)
-                    db.update_one({'_id': rule['_id']}, {'$set': {
-                        'next_run': rule['next_run'] + (60 * 60 * 24 * 14)
-                    }})
+        for action in await storage.run(list, scheduler.due_recurring(functools.partial(utility.local_guild, self.bot)), lane='scan'):
+            await self.post_recurring(action)
+
+    @_recurring_event_trigger.before_loop
+    async def _wait_for_catch_up(self):
+        previous = self.handoff.get('recurring_event_trigger')
+        if previous:
+            await asyncio.wait([previous]) # Stops at its next deadline, where the first tick here takes over
+
+        await self.bot.get_cog('Background').caught_up.wait()
+
+    async def post_recurring(self, action):
+        """
+        Post the next reservation of a recurring rule. Skipped if the rule has already advanced past the planned run.
+        """
+        db = storage.recurring(action['guild'])
+        rule = await storage.run(db.find_one, {'_id': action['rule']})
+        if not rule or rule['next_run'] != action['run']:
+            return
+
+        if action['day'] is None:
+            logging.info(f'[Main] Recurring event "{rule["description"]}" missed its runs while the bot was down and has been advanced to its next run')
+
+        else:
+            await self._create_reservation(day=action['day'], tz=utility.timezone_alias(rule['timezone']), desc=rule['description'], recurr=rule)
+
+        await storage.run(db.update_one, {'_id': rule['_id']}, {'$set': {
+            'next_run': action['next_run']
+        }})
 
     async def msg_wait(self, ctx, values: list, _int=False, _list=False, content=None, embed=None, timeout=60.0):
         def check(m):
@@ -166,7 +279,7 @@ class Main(commands.Cog, name='RSVP Bot'):
         while True:
             try:
                 try:
-                    message = await self.bot.wait_for('message', timeout=timeout, check=check)
+                    message = await self.wait_for_user(ctx, 'message', timeout=timeout, check=check)
 
                 except asyncio.TimeoutError:
                     await channelMsg.edit(content=f'{ctx.author.mention} The action timed out because of inactivity. Run the command again to try again')
@@ -215,7 +328,7 @@ class Main(commands.Cog, name='RSVP Bot'):
                     channelMsg = await ctx.send('That value doesn\'t look right, please try again.', embed=embed)
 
     async def _allowed(ctx):
-        guild = mclient.rsvpbot.config.find_one({'_id': ctx.guild.id})
+        guild = await storage.run(mclient.rsvpbot.config.find_one, {'_id': ctx.guild.id})
 
         if not guild:
             # Guild not setup, command not allowed
@@ -232,10 +345,10 @@ class Main(commands.Cog, name='RSVP Bot'):
         embed.set_footer(text='RSVP Bot © MattBSG 2020')
 
         if not isinstance(guild, discord.Guild): guild = bot.get_guild(guild)
-        guild_doc = mclient.rsvpbot.config.find_one({'_id': guild.id})
+        guild_doc = await storage.run(mclient.rsvpbot.config.find_one, {'_id': guild.id})
 
         if rsvp:
-            doc = mclient.rsvpbot.reservations.find_one({'_id': rsvp})
+            doc = await storage.run(storage.reservations(guild.id).find_one, {'_id': rsvp})
             if not doc:
                 raise exceptions.NotFound('Reservation does not exist')
 
@@ -245,7 +358,7 @@ class Main(commands.Cog, name='RSVP Bot'):
 
             user_aliases = {}
             user_db = mclient.rsvpbot.users
-            alias_docs = user_db.find({'_id': {'$in': [x['user'] for x in doc['participants']]}})
+            alias_docs = await storage.run(user_db.find, {'_id': {'$in': [x['user'] for x in doc['participants']]}})
             for x in alias_docs:
                 user_aliases[x['_id']] = x['alias']
 
@@ -314,55 +427,58 @@ class Main(commands.Cog, name='RSVP Bot'):
         if rsvp:
             try:
                 message = await rsvp_channel.fetch_message(rsvp)
-                await message.edit(embed=embed)
+                await self.sender.submit(rsvp_channel.id, outbound.MESSAGES, outbound.EDIT, message.edit, embed=embed)
 
             except (discord.NotFound, discord.Forbidden):
                 logging.error(f'[Main] Unable to fetch RSVP message {rsvp}, resending! Was it deleted?')
-                message = await rsvp_channel.send(embed=embed)
+                message = await self.sender.submit(rsvp_channel.id, outbound.MESSAGES, outbound.EDIT, rsvp_channel.send, embed=embed)
 
         else:
-            message = await rsvp_channel.send(embed=embed)
+            message = await self.sender.submit(rsvp_channel.id, outbound.MESSAGES, outbound.EDIT, rsvp_channel.send, embed=embed)
 
         return message
 
-    async def _create_reservation(self, bot=None, ctx=None, day=None, time=None, tz=None, desc=None, recurr=None):
-        if recurr:
-            event_start = pendulum.from_timestamp(day, tz=tz)
-
+    def _event_start(self, day, time, tz):
+        """
+        Return the next start of an event on a day of the week at a time, raising if any part is invalid.
+        """
+        if tz.lower() in constants.TIMEZONE_ALIASES:
+            timezone = pendulum.timezone(constants.TIMEZONE_ALIASES[tz.lower()])
 
         else:
-            if tz.lower() in constants.TIMEZONE_ALIASES:
-                timezone = pendulum.timezone(constants.TIMEZONE_ALIASES[tz.lower()])
-
-            else:
-                try:
-                    timezone = pendulum.timezone(tz.lower())
+            try:
+                timezone = pendulum.timezone(tz.lower())
 
-                except pendulum.tz.zoneinfo.exceptions.InvalidTimezone:
-                    raise exceptions.InvalidTz
+            except pendulum.tz.zoneinfo.exceptions.InvalidTimezone:
+                raise exceptions.InvalidTz
 
-            current_time = pendulum.now(timezone)
+        current_time = pendulum.now(timezone)
 
-            try:
-                event_time = pendulum.parse(time, tz=timezone, strict=False).on(current_time.year, current_time.month, current_time.day)
+        try:
+            event_time = pendulum.parse(time, tz=timezone, strict=False).on(current_time.year, current_time.month, current_time.day)
 
-            except pendulum.parsing.exceptions.ParserError:
-                raise exceptions.InvalidTime
+        except pendulum.parsing.exceptions.ParserError:
+            raise exceptions.InvalidTime
 
-            if day.lower() not in constants.DAY_MAPPING:
-                raise exceptions.InvalidDOW
+        if day.lower() not in constants.DAY_MAPPING:
+            raise exceptions.InvalidDOW
 
-            if current_time.day_of_week == constants.DAY_MAPPING[day.lower()] and event_time > current_time:
-                # Same as today, but in future
-                event_start = event_time
+        if current_time.day_of_week == constants.DAY_MAPPING[day.lower()] and event_time > current_time:
+            # Same as today, but in future
+            return event_time
 
-            else:
-                # In the future or current day (but already elasped)
-                event_start = event_time.next(constants.DAYS[constants.DAY_MAPPING[day.lower()]]).at(event_time.hour, event_time.minute)
+        # In the future or current day (but already elasped)
+        return event_time.next(constants.DAYS[constants.DAY_MAPPING[day.lower()]]).at(event_time.hour, event_time.minute)
 
+    async def _post_reservation(self, bot, ctx, event_start, tz, desc, recurr=None):
+        """
+        Send a reservation's embed and start seeding its reactions. Returns the reservation document, which
+        is not yet stored, the message, and a future that finishes once the reactions are seeded.
+        """
+        config = None if recurr else await storage.run(mclient.rsvpbot.config.find_one, {'_id': ctx.guild.id})
         rsvp_event = {
             'host': ctx.author if not recurr else recurr['host'],
-            'channel': mclient.rsvpbot.config.find_one({'_id': ctx.guild.id})['rsvp_channel'] if not recurr else recurr['channel'],
+            'channel': config['rsvp_channel'] if not recurr else recurr['channel'],
             'guild': ctx.guild.id if not recurr else recurr['guild'],
             'date': event_start,
             'timezone': utility.timezone_alias(tz),
@@ -379,10 +495,25 @@ class Main(commands.Cog, name='RSVP Bot'):
         rsvp_event['host'] = ctx.author.id if not recurr else recurr['host']
         rsvp_event['date'] = event_start.int_timestamp
 
-        mclient.rsvpbot.reservations.insert_one(rsvp_event)
+        seeding = asyncio.gather(*[self.sender.submit(rsvp_message.channel.id, outbound.REACTIONS, outbound.SEED, rsvp_message.add_reaction, x) for x in self.REACT_EMOJI])
+        return rsvp_event, rsvp_message, seeding
+
+    async def _create_reservation(self, bot=None, ctx=None, day=None, time=None, tz=None, desc=None, recurr=None):
+        if recurr:
+            event_start = pendulum.from_timestamp(day, tz=tz)
+
+        else:
+            event_start = self._event_start(day, time, tz)
+
+        rsvp_event, rsvp_message, seeding = await self._post_reservation(bot, ctx, event_start, tz, desc, recurr)
+
+        def store():
+            storage.reservations(rsvp_event['guild']).insert_one(rsvp_event)
+            storage.track_reservation(rsvp_event['guild'], rsvp_event['date'], rsvp_event['_id'])
+
+        await storage.run(store, guild=rsvp_event['guild'])
 
-        for emoji in self.REACT_EMOJI:
-            await rsvp_message.add_reaction(emoji)
+        await seeding
 
         return event_start.format('MMM Do, Y at h:mmA') + ' ' + tz.lower().capitalize(), rsvp_message
 
@@ -401,7 +532,7 @@ class Main(commands.Cog, name='RSVP Bot'):
         if ctx.author.id not in [app_info.owner.id, ctx.guild.owner.id]:
             return await ctx.send(f'{ctx.author.mention} You must be the owner of this server or bot to use this command')
 
-        setup = db.find_one({'_id': ctx.guild.id})
+        setup = await storage.run(db.find_one, {'_id': ctx.guild.id})
 
         try:
             rsvp_channel = await self.msg_wait(ctx, [x.id for x in ctx.guild.channels], _int=True, content=f'Hi, I\'m RSVP Bot. Let\'s get your server setup to use raid rsvp features. First off, what channel would you like RSVP signups in? Please send the channel ID (i.e. {ctx.guild.channels[0].id}).')
@@ -412,7 +543,7 @@ class Main(commands.Cog, name='RSVP Bot'):
             rsvp_admins = await self.msg_wait(ctx, [x.id for x in ctx.guild.roles], _int=True, _list=True, content=f'Awesome. Please send the IDs of all roles that should have admin priviledges. This can be just one ID, or a comma seperated list (i.e. id1, id2, id3).', timeout=120.0)
 
             if not setup:
-                mclient.rsvpbot.config.insert_one({
+                await storage.run(mclient.rsvpbot.config.insert_one, {
                     '_id': ctx.guild.id,
                     'rsvp_channel': rsvp_channel,
                     'info_channel': info_channel,
@@ -422,7 +553,7 @@ class Main(commands.Cog, name='RSVP Bot'):
                 })
 
             else:
-                mclient.rsvpbot.config.update_one({'_id': ctx.guild.id}, {
+                await storage.run(mclient.rsvpbot.config.update_one, {'_id': ctx.guild.id}, {
                     '_id': ctx.guild.id,
                     'rsvp_channel': rsvp_channel,
                     'info_channel': info_channel,
@@ -450,12 +581,92 @@ class Main(commands.Cog, name='RSVP Bot'):
             rsvp friday 10pm eastern Join us for a casual late night raid
             rsvp tuesday 1:15am America/New_York Who said early morning was too early?
         """
-        config = mclient.rsvpbot.config.find_one({'_id': ctx.guild.id})
-
         time_to, rsvp_message = await self._create_reservation(self.bot, ctx, day, time, timezone, description)
 
         await ctx.send(f'Success! Event created starting {time_to}')
 
+    @_rsvp.command(name='bulk')
+    @commands.check(_allowed)
+    async def _rsvp_bulk(self, ctx, *, schedule):
+        """
+        Creates several RSVP reservations at once.
+
+        Takes one reservation per line, each in the same format as the rsvp command. Every line is
+        checked before any reservation is created. At most 25 reservations can be created at once.
+        Example usage:
+            rsvp bulk
+            tuesday 8pm eastern Tuesday raid
+            thursday 8pm eastern Thursday raid
+            saturday 1:30pm America/New_York Weekend raid
+        """
+        lines = [x.strip() for x in schedule.split('\n') if x.strip()]
+        if len(lines) > BULK_LIMIT:
+            return await ctx.send(f':x: {ctx.author.mention} At most {BULK_LIMIT} reservations can be created at once, you provided {len(lines)}')
+
+        events = []
+        errors = []
+        for number, line in enumerate(lines, 1):
+            parts = line.split(maxsplit=3)
+            if len(parts) < 4:
+                errors.append(f'Line {number}: expected a day, time, timezone and description')
+                continue
+
+            try:
+                events.append((self._event_start(*parts[:3]), parts[2], parts[3]))
+
+            except exceptions.InvalidTz:
+                errors.append(f'Line {number}: "{parts[2]}" is not a valid timezone')
+
+            except exceptions.InvalidTime:
+                errors.append(f'Line {number}: "{parts[1]}" is not a valid time')
+
+            except exceptions.InvalidDOW:
+                errors.append(f'Line {number}: "{parts[0]}" is not a valid day of the week')
+
+        if errors:
+            return await ctx.send(f':x: {ctx.author.mention} No reservations were created, please fix the following and try again:\n' + '\n'.join(errors))
+
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+        async def post(event_start, tz, desc):
+            async with semaphore:
+                return await self._post_reservation(self.bot, ctx, event_start, tz, desc)
+
+        results = await asyncio.gather(*[post(*x) for x in events], return_exceptions=True)
+        posted = []
+        times = []
+        failed = []
+        for number, (event, result) in enumerate(zip(events, results), 1):
+            if isinstance(result, Exception):
+                logging.error(f'[Main] Unable to post reservation from line {number} of a bulk schedule. Guild ({ctx.guild.id}) | Error from Discord: {result}')
+                failed.append(f'Line {number}: {result}')
+
+            else:
+                posted.append(result)
+                times.append(f'{event[0].format("MMM Do, Y at h:mmA")} {event[1].lower().capitalize()}')
+
+        if posted:
+            # Store every posted reservation with one write while reactions are still being seeded
+            docs = [x[0] for x in posted]
+            def store():
+                storage.reservations(ctx.guild.id).insert_many(docs)
+                for doc in docs:
+                    storage.track_reservation(ctx.guild.id, doc['date'], doc['_id'])
+
+            await storage.run(store, guild=ctx.guild.id)
+
+            for result in await asyncio.gather(*[x[2] for x in posted], return_exceptions=True):
+                if isinstance(result, Exception):
+                    logging.error(f'[Main] Unable to add reactions to a bulk reservation. Guild ({ctx.guild.id}) | Error from Discord: {result}')
+
+        if not failed:
+            return await ctx.send(f':white_check_mark: Success! {len(posted)} event{utility.plural(len(posted))} created starting:\n' + '\n'.join(times))
+
+        content = f':warning: {ctx.author.mention} {len(posted)} of {len(events)} events were created. The following could not be posted:\n' + '\n'.join(failed)
+        if times:
+            content += '\n\nCreated events starting:\n' + '\n'.join(times)
+
+        await ctx.send(content)
+
     @_rsvp.group(name='recurr', invoke_without_command=True)
     @commands.check(_allowed)
     async def _rsvp_recurr(self, ctx, reservation: typing.Union[int, str], frequency):
@@ -472,21 +683,22 @@ class Main(commands.Cog, name='RSVP Bot'):
         if frequency not in ['daily', 'weekly', 'biweekly']:
             return await ctx.send(f':x: {ctx.author.mention} The provided frequency "{frequency}" is not valid. It should be either "daily", "weekly", or "biweekly"')
 
-        db = mclient.rsvpbot.recurring
+        db = storage.recurring(ctx.guild.id)
+        reservations_db = storage.reservations(ctx.guild.id)
         if isinstance(reservation, int):
-            rsvp = mclient.rsvpbot.reservations.find_one({'_id': reservation, 'active': True})
+            rsvp = await storage.run(reservations_db.find_one, {'_id': reservation, 'active': True})
 
         else: # String
             match = re.search(r'https:\/\/\w*\.?discord(?:app)?.com\/channels\/\d+\/\d+\/(\d+)', reservation, flags=re.I)
             if not match:
                 return await ctx.send(f':x: {ctx.author.mention} The reservation provided is invalid. Make sure you use a message ID or message link')
 
-            rsvp = mclient.rsvpbot.reservations.find_one({'_id': int(match.group(1)), 'active': True})
+            rsvp = await storage.run(reservations_db.find_one, {'_id': int(match.group(1)), 'active': True})
 
         if not rsvp:
             return await ctx.send(f':x: {ctx.author.mention} The provided reservation is either inactive, not not valid')
 
-        recurr = db.find_one({'description': rsvp['description']})
+        recurr = await storage.run(db.find_one, {'description': rsvp['description']})
         if recurr:
             return await ctx.send(f':x: {ctx.author.mention} That event is already recurring {recurr["freq"]}. If you wish to change the frequency, you must stop it from recurring first. '\
                             f'See `{ctx.prefix}help rsvp recurr` for more info')
@@ -497,7 +709,7 @@ class Main(commands.Cog, name='RSVP Bot'):
         else: # biweekly
             next_run = rsvp['date'] + (60 * 60 * 24 * 7) # 1 week delay
 
-        doc = db.insert_one({
+        doc = await storage.run(db.insert_one, {
             'freq': frequency,
             'next_run': next_run,
             'host': rsvp['host'],
@@ -506,7 +718,7 @@ class Main(commands.Cog, name='RSVP Bot'):
             'timezone': rsvp['timezone'],
             'description': rsvp['description'],
         })
-        mclient.rsvpbot.reservations.update_one({'_id': rsvp['_id']}, {
+        await storage.run(reservations_db.update_one, {'_id': rsvp['_id']}, {
             'recurring': doc.inserted_id
         })
 
@@ -524,15 +736,16 @@ class Main(commands.Cog, name='RSVP Bot'):
             rsvp recurr stop 748993895131775057
             rsvp recurr stop https://discordapp.com/channels/314857672585248768/314857672585248768/748995539026182296
         """
+        reservations_db = storage.reservations(ctx.guild.id)
         if isinstance(reservation, int):
-            rsvp = mclient.rsvpbot.reservations.find_one({'_id': reservation})
+            rsvp = await storage.run(reservations_db.find_one, {'_id': reservation})
 
         else: # String
             match = re.search(r'https:\/\/\w*\.?discord(?:app)?.com\/channels\/\d+\/\d+\/(\d+)', reservation, flags=re.I)
             if not match:
                 return await ctx.send(f':x: {ctx.author.mention} The reservation provided is invalid. Make sure you use a message ID or message link')
 
-            rsvp = mclient.rsvpbot.reservations.find_one({'_id': int(match.group(1))})
+            rsvp = await storage.run(reservations_db.find_one, {'_id': int(match.group(1))})
 
         if not rsvp:
             return await ctx.send(f':x: {ctx.author.mention} The provided message is not a reservation')
@@ -540,12 +753,13 @@ class Main(commands.Cog, name='RSVP Bot'):
         if not rsvp['recurring']:
             return await ctx.send(f':x: {ctx.author.mention} The provided event reservation is not currently recurring')
 
-        recurr = mclient.rsvpbot.recurring.find_one({'_id': rsvp['recurring']})
+        recurring_db = storage.recurring(ctx.guild.id)
+        recurr = await storage.run(recurring_db.find_one, {'_id': rsvp['recurring']})
         if not recurr:
             # This would be caused by an event previously recurring, but is not currently
             return await ctx.send(f':x: {ctx.author.mention} The provided event reservation is not currently recurring')
 
-        mclient.rsvpbot.recurring.delete_one({'_id': recurr['_id']})
+        await storage.run(recurring_db.delete_one, {'_id': recurr['_id']})
 
         await ctx.send(f':white_check_mark: {ctx.author.mention} Success! The event is no longer recurring. Any active reservations part of this series will '\
                         'still continue to function until canceled')
@@ -570,23 +784,26 @@ class Main(commands.Cog, name='RSVP Bot'):
             if not alias: await ctx.send(f':x: {ctx.author.mention} A name to alias this user to is required')
             new_alias = alias if mode == 'set' else None
             user_db = mclient.rsvpbot.users
-            if user_db.find_one({'_id': member.id}):
-                user_db.update_one({'_id': member.id}, {
-                    '$set': {
+            def set_alias():
+                if user_db.find_one({'_id': member.id}):
+                    user_db.update_one({'_id': member.id}, {
+                        '$set': {
+                            'alias': alias
+                        }
+                    })
+
+                else:
+                    user_db.insert_one({
+                        '_id': member.id,
                         'alias': alias
-                    }
-                })
+                    })
 
-            else:
-                user_db.insert_one({
-                    '_id': member.id,
-                    'alias': alias
-                })
+            await storage.run(set_alias)
 
             await ctx.send(f':white_check_mark: {ctx.author.mention}  Success! Alias for {member} has been set to `{alias}`')
 
         else:
-            mclient.rsvpbot.users.delete_one({'_id': member.id})
+            await storage.run(mclient.rsvpbot.users.delete_one, {'_id': member.id})
             await ctx.send(f':white_check_mark: {ctx.author.mention} Success! Alias for {member} has been cleared')
 
 
@@ -601,7 +818,7 @@ class Main(commands.Cog, name='RSVP Bot'):
         Example:
             rsvp message The raid will be starting soon, please login and join the voice channel!
         """
-        mclient.rsvpbot.config.update_one({'_id': ctx.guild.id}, {
+        await storage.run(mclient.rsvpbot.config.update_one, {'_id': ctx.guild.id}, {
             '$set': {
                 'invite_message': content
             }
@@ -630,7 +847,8 @@ class Main(commands.Cog, name='RSVP Bot'):
 
             messageID = int(match.group(1))
 
-        reservation = mclient.rsvpbot.reservations.find_one({'_id': messageID})
+        reservations_db = storage.reservations(ctx.guild.id)
+        reservation = await storage.run(reservations_db.find_one, {'_id': messageID})
         if not reservation:
             return await ctx.send(f':x: {ctx.author.mention} That message is not an active RSVP')
 
@@ -643,42 +861,343 @@ class Main(commands.Cog, name='RSVP Bot'):
         except (discord.NotFound, discord.Forbidden, AttributeError):
             return await ctx.send(f':x: {ctx.author.mention} That RSVP message either no longer exists or I unable to view it\'s channel')
 
-        mclient.rsvpbot.reservations.update_one({'_id': reservation['_id']}, {
-            '$set': {
-                'active': False
-            }
-        })
+        def cancel():
+            reservations_db.update_one({'_id': reservation['_id']}, {
+                '$set': {
+                    'active': False,
+                    'canceled': True,
+                    'counted': True
+                }
+            })
+            storage.untrack_reservation(ctx.guild.id, reservation['_id'])
+            if not reservation.get('counted'):
+                stats.record_canceled(reservation)
+
+        await storage.run(cancel, guild=ctx.guild.id)
 
         embed = rsvp_message.embeds[0]
         embed.color = 0xB84444
         embed.title = '[Canceled] ' + embed.title
         embed.remove_field(3) # How-to-signup field
 
-        await rsvp_message.edit(embed=embed)
-        await rsvp_message.clear_reactions()
+        self.sender.discard(rsvp_message.id)
+        await self.sender.submit(rsvp_message.channel.id, outbound.MESSAGES, outbound.EDIT, rsvp_message.edit, embed=embed)
+        await self.sender.submit(rsvp_message.channel.id, outbound.REACTIONS, outbound.EDIT, rsvp_message.clear_reactions)
         await ctx.send(f':white_check_mark: {ctx.author.mention} Success! That event has been canceled')
 
+    @_rsvp.command(name='list')
+    @commands.check(_allowed)
+    async def _rsvp_list(self, ctx, days: int = None):
+        """
+        Lists upcoming reservations.
+
+        Shows active reservations in date order with their message IDs and signups, optionally
+        only those starting within a number of days. Use the arrow reactions to change pages.
+        Example usage:
+            rsvp list
+            rsvp list 7
+        """
+        now = pendulum.now('UTC')
+        entries = await storage.run(storage.upcoming, ctx.guild.id, now.int_timestamp, None if days is None else now.add(days=days).int_timestamp, guild=ctx.guild.id)
+        if not entries:
+            return await ctx.send(f':x: {ctx.author.mention} There are no upcoming reservations{"" if days is None else f" in the next {days} day{utility.plural(days)}"}')
+
+        pages = [entries[i:i + LIST_PAGE_SIZE] for i in range(0, len(entries), LIST_PAGE_SIZE)]
+        page = 0
+
+        async def list_embed():
+            embed = discord.Embed(title='Upcoming Reservations', color=0x3B6F4D)
+            embed.set_footer(text=f'Page {page + 1} of {len(pages)} | RSVP Bot © MattBSG 2020')
+            docs = {x['_id']: x for x in await storage.run(storage.reservations(ctx.guild.id).find, {'_id': {'$in': [x[1] for x in pages[page]]}})}
+            for date, _id in pages[page]:
+                doc = docs.get(_id)
+                if not doc: continue
+                roles = {'tank': 0, 'healer': 0, 'dps': 0}
+                for participant in doc['participants']:
+                    roles[participant['role']] += 1
+
+                start = pendulum.from_timestamp(date, tz=utility.timezone_alias(doc['timezone']))
+                description = doc['description'] if len(doc['description']) <= 100 else doc['description'][:97] + '...'
+                embed.add_field(name=f'{start.format("ddd MMM Do, h:mmA")} {doc["timezone"].capitalize()} | {description}',
+                                value=f'[{_id}](https://discord.com/channels/{ctx.guild.id}/{doc["channel"]}/{_id}) :man_raising_hand: **{len(doc["participants"])}** signed up: ' \
+                                      f'{constants.EMOJI_TANK}{roles["tank"]} {constants.EMOJI_HEALER}{roles["healer"]} {constants.EMOJI_DPS}{roles["dps"]}',
+                                inline=False)
+
+            return embed
+
+        message = await ctx.send(embed=await list_embed())
+        if len(pages) == 1:
+            return
+
+        for emoji in LIST_EMOJI:
+            await message.add_reaction(emoji)
+
+        def check(reaction, user):
+            return reaction.message.id == message.id and user.id == ctx.author.id and str(reaction.emoji) in LIST_EMOJI
+
+        while True:
+            try:
+                reaction, user = await self.wait_for_user(ctx, 'reaction_add', timeout=60.0, check=check)
+
+            except asyncio.TimeoutError:
+                try:
+                    await message.clear_reactions()
+
+                except (discord.Forbidden, discord.NotFound):
+                    pass
+
+                return
+
+            page = (page + (1 if str(reaction.emoji) == LIST_EMOJI[1] else -1)) % len(pages)
+            await message.edit(embed=await list_embed())
+            try:
+                await message.remove_reaction(reaction.emoji, user)
+
+            except (discord.Forbidden, discord.NotFound):
+                pass
+
+    @_rsvp.group(name='stats', invoke_without_command=True)
+    @commands.check(_allowed)
+    async def _rsvp_stats(self, ctx, member: discord.Member = None):
+        """
+        Shows attendance statistics for the server or a member.
+
+        Statistics are counted as events lock in or are canceled. Withdrawing from an
+        event less than 2 hours before it starts counts as a no-show. Use "rsvp stats backfill"
+        once to include events from before statistics were kept.
+        Example usage:
+            rsvp stats
+            rsvp stats @MattBSG#8888
+        """
+        embed = discord.Embed(title='Attendance Statistics', color=0x3B6F4D)
+        embed.set_footer(text='RSVP Bot © MattBSG 2020')
+        guild_doc = await storage.run(stats.guild_stats, ctx.guild.id, guild=ctx.guild.id)
+
+        if member:
+            doc = await storage.run(stats.member_stats, ctx.guild.id, member.id, guild=ctx.guild.id)
+            if not doc:
+                return await ctx.send(f':x: {ctx.author.mention} There are no statistics for {member} yet')
+
+            roles = doc.get('roles', {})
+            statuses = doc.get('statuses', {})
+            embed.title += f' for {member.display_name}'
+            embed.add_field(name='Signups', value=f'**{doc.get("signups", 0)}** event{utility.plural(doc.get("signups", 0))}, hosted **{doc.get("hosted", 0)}**', inline=True)
+            embed.add_field(name='Roles', value=f'{constants.EMOJI_TANK}**{roles.get("tank", 0)}** {constants.EMOJI_HEALER}**{roles.get("healer", 0)}** {constants.EMOJI_DPS}**{roles.get("dps", 0)}**', inline=True)
+            embed.add_field(name='Status', value=f'{constants.EMOJI_TENTATIVE}**{statuses.get("tentative", 0)}** tentative, {constants.EMOJI_LATE}**{statuses.get("late", 0)}** late', inline=True)
+            embed.add_field(name='Withdrawals', value=f'**{doc.get("withdrawn", 0)}** withdrawn, **{doc.get("no_shows", 0)}** no-show{utility.plural(doc.get("no_shows", 0))}', inline=True)
+            embed.add_field(name='Canceled events', value=f'**{doc.get("canceled", 0)}**', inline=True)
+            if doc.get('last_event'):
+                embed.add_field(name='Last event', value=pendulum.from_timestamp(doc['last_event']).format('MMM Do, Y'), inline=True)
+
+        else:
+            if not guild_doc or not (guild_doc.get('events') or guild_doc.get('canceled')):
+                return await ctx.send(f':x: {ctx.author.mention} There are no statistics for this server yet')
+
+            events = guild_doc.get('events', 0)
+            roles = guild_doc.get('roles', {})
+            embed.add_field(name='Events', value=f'**{events}** held, **{guild_doc.get("canceled", 0)}** canceled', inline=True)
+            embed.add_field(name='Signups', value=f'**{guild_doc.get("signups", 0)}** total, **{guild_doc.get("signups", 0) / events if events else 0:.1f}** per event', inline=True)
+            embed.add_field(name='Roles', value=f'{constants.EMOJI_TANK}**{roles.get("tank", 0)}** {constants.EMOJI_HEALER}**{roles.get("healer", 0)}** {constants.EMOJI_DPS}**{roles.get("dps", 0)}**', inline=True)
+
+            months = []
+            for month, counts in sorted(guild_doc.get('months', {}).items(), reverse=True)[:6]:
+                months.append(f'`{month}` **{counts.get("events", 0)}** event{utility.plural(counts.get("events", 0))}: ' \
+                              f'{constants.EMOJI_TANK}{counts.get("tank", 0)} {constants.EMOJI_HEALER}{counts.get("healer", 0)} {constants.EMOJI_DPS}{counts.get("dps", 0)}')
+
+            if months:
+                embed.add_field(name='Recent months', value='\n'.join(months), inline=False)
+
+        if not guild_doc or not guild_doc.get('backfilled'):
+            embed.description = f'Events from before statistics were kept are not counted. Use `{ctx.prefix}rsvp stats backfill` to include them'
+
+        await ctx.send(embed=embed)
+
+    @_rsvp_stats.command(name='backfill')
+    @commands.check(_allowed)
+    async def _rsvp_stats_backfill(self, ctx):
+        """
+        Counts past events into attendance statistics.
+
+        Only needs to be run once per server. Events already counted are skipped.
+        Example usage:
+            rsvp stats backfill
+        """
+        await ctx.send(f':hourglass: {ctx.author.mention} Counting past events, this may take a while for servers with a long history')
+        counted = await stats.backfill(ctx.guild.id)
+        await ctx.send(f':white_check_mark: {ctx.author.mention} Success! **{counted}** past event{utility.plural(counted)} have been added to the statistics')
+
+    @_rsvp.command(name='export')
+    @commands.check(_allowed)
+    async def _rsvp_export(self, ctx, fmt='jsonl'):
+        """
+        Exports this server's reservations, recurring events and aliases.
+
+        Format is either "jsonl" (default) or "csv". The export is sent as a file, or
+        saved in the bot's exports folder if it is too large to upload.
+        Example usage:
+            rsvp export
+            rsvp export csv
+        """
+        fmt = fmt.lower()
+        if fmt not in ['jsonl', 'csv']:
+            return await ctx.send(f':x: {ctx.author.mention} The provided format "{fmt}" is not valid. It should be either "jsonl" or "csv"')
+
+        os.makedirs('exports', exist_ok=True)
+        path = os.path.join('exports', f'{ctx.guild.id}-{pendulum.now("UTC").format("YYYYMMDD-HHmmss")}.{fmt}')
+        lines = transfer.export_lines(ctx.guild.id, fmt)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            while True:
+                # Read in chunks so other storage work is not held up for the whole export
+                chunk = await storage.run(list, itertools.islice(lines, transfer.CHUNK), guild=ctx.guild.id)
+                if not chunk:
+                    break
+
+                f.writelines(chunk)
+
+        if os.path.getsize(path) > ctx.guild.filesize_limit:
+            return await ctx.send(f':white_check_mark: {ctx.author.mention} Success! The export is too large to upload and has been saved to `{path}` on the bot\'s host')
+
+        await ctx.send(f':white_check_mark: {ctx.author.mention} Success! Here is the export for this server', file=discord.File(path))
+        os.remove(path)
+
+    @_rsvp.command(name='import')
+    @commands.check(_allowed)
+    async def _rsvp_import(self, ctx):
+        """
+        Imports reservations, recurring events and aliases from an export.
+
+        Attach a file created by the export command to the message. Records that
+        already exist, or belong to another server, are skipped. So are events
+        in channels outside this server and aliases of users not in it.
+        Example usage:
+            rsvp import
+        """
+        if not ctx.message.attachments:
+            return await ctx.send(f':x: {ctx.author.mention} Attach a file created by the `{ctx.prefix}rsvp export` command to import it')
+
+        attachment = ctx.message.attachments[0]
+        fmt = 'csv' if attachment.filename.lower().endswith('.csv') else 'jsonl'
+        inserted = 0
+        channels = set(x.id for x in ctx.guild.channels)
+        members = set(x.id for x in ctx.guild.members)
+
+        def accept(_type, doc):
+            # The file is user supplied, don't let it point at messages or users of other servers
+            if _type == 'alias':
+                return doc['_id'] in members
+
+            return doc['channel'] in channels
+        with tempfile.TemporaryFile() as f:
+            await attachment.save(f)
+            f.seek(0)
+            batches = transfer.import_lines(io.TextIOWrapper(f, encoding='utf-8', newline=''), fmt, ctx.guild.id, accept)
+            try:
+                # One batch per storage call, so other storage work is not held up for the whole import
+                while True:
+                    count = await storage.run(next, batches, None, guild=ctx.guild.id)
+                    if count is None:
+                        break
+
+                    inserted = count
+
+            except (ValueError, KeyError, TypeError) as e:
+                logging.error(f'[Main] Unable to import {attachment.filename} for guild {ctx.guild.id}: {e}')
+                return await ctx.send(f':x: {ctx.author.mention} That file is not a valid export. **{inserted}** record{utility.plural(inserted)} were imported before the error')
+
+        await ctx.send(f':white_check_mark: {ctx.author.mention} Success! **{inserted}** record{utility.plural(inserted)} have been imported')
+
+    @_rsvp.group(name='debug', invoke_without_command=True)
+    @commands.check(_allowed)
+    async def _rsvp_debug(self, ctx):
+        """
+        Diagnostic commands for bot administrators.
+
+        Example usage:
+            rsvp debug perf
+            rsvp debug reload
+        """
+        await ctx.send_help(ctx.command)
+
+    @_rsvp_debug.command(name='perf')
+    @commands.check(_allowed)
+    async def _rsvp_debug_perf(self, ctx):
+        """
+        Shows event loop lag and the slowest handlers.
+
+        Reports event loop lag, the longest stalls of the event loop and the slowest
+        handlers and background ticks. Requires DIAGNOSTICS to be enabled in the constants file.
+        Example usage:
+            rsvp debug perf
+        """
+        if not diagnostics.watchdog:
+            return await ctx.send(f':x: {ctx.author.mention} Diagnostics are not enabled. Set `DIAGNOSTICS = True` in your constants file and restart the bot')
+
+        summary = diagnostics.watchdog.summary()
+        if len(summary) > 1950:
+            summary = summary[:1950] + '\n...'
+
+        await ctx.send(f'```\n{summary}```')
+
+    @_rsvp_debug.command(name='reload')
+    @commands.is_owner()
+    async def _rsvp_debug_reload(self, ctx):
+        """
+        Reloads the bot's main module without restarting.
+
+        Deploys code changes to the main module in place. Queued messages, the scheduler and its
+        outbox deliveries, and diagnostics carry over to the reloaded module. Only the bot owner can use this command.
+        Example usage:
+            rsvp debug reload
+        """
+        self.bot.rsvp_handoff = {}
+        try:
+            self.bot.reload_extension('modules.main')
+
+        except commands.ExtensionError as e:
+            logging.exception('[Main] Unable to reload the main module, the previous version is still running')
+            return await ctx.send(f':x: {ctx.author.mention} Unable to reload, the previous version is still running: {e}')
+
+        finally:
+            self.bot.rsvp_handoff = None
+
+        logging.info('[Main] Main module reloaded')
+        await ctx.send(f':white_check_mark: {ctx.author.mention} Reloaded')
+
     @commands.Cog.listener()
+    @diagnostics.timed
     async def on_raw_message_delete(self, payload):
-        db = mclient.rsvpbot.reservations
-        if db.find_one({'_id': payload.message_id}):
-            config = mclient.rsvpbot.config.find_one({'_id': payload.guild_id})
+        if not payload.guild_id: return
+        db = storage.reservations(payload.guild_id)
+        rsvp = await storage.run(db.find_one, {'_id': payload.message_id})
+        if rsvp:
+            config = await storage.run(mclient.rsvpbot.config.find_one, {'_id': payload.guild_id})
             admin_channel = self.bot.get_channel(config['admin_channel'])
             await admin_channel.send(f':bangbang: An RSVP message was deleted from <#{config["rsvp_channel"]}> and has been canceled! Please use the `rsvp cancel` command in the future instead!')
-            mclient.rsvpbot.reservations.update_one({'_id': payload.message_id}, {
-                '$set': {
-                    'active': False
-                }
-            })
+            if not rsvp['active']:
+                return
+
+            def cancel():
+                db.update_one({'_id': payload.message_id}, {
+                    '$set': {
+                        'active': False,
+                        'canceled': True,
+                        'counted': True
+                    }
+                })
+                storage.untrack_reservation(payload.guild_id, payload.message_id)
+                if not rsvp.get('counted'):
+                    stats.record_canceled(rsvp)
+
+            await storage.run(cancel, guild=payload.guild_id)
 
     @commands.Cog.listener()
+    @diagnostics.timed
     async def on_raw_reaction_add(self, payload):
         if payload.member.bot: return
-        message = await self.bot.get_channel(payload.channel_id).fetch_message(payload.message_id)
 
-        db = mclient.rsvpbot.reservations
+        db = storage.reservations(payload.guild_id)
         user_db = mclient.rsvpbot.users
-        rsvp_msg = db.find_one({'_id': payload.message_id, 'active': True})
+        rsvp_msg = await storage.run(db.find_one, {'_id': payload.message_id, 'active': True})
         if not rsvp_msg:
             return
 
@@ -691,77 +1210,85 @@ class Main(commands.Cog, name='RSVP Bot'):
             emoji += f':{payload.emoji.name}:{payload.emoji.id}>'
 
         if emoji not in self.REACT_EMOJI: return
-        userStatus = None
         if emoji in [constants.EMOJI_DPS, constants.EMOJI_HEALER, constants.EMOJI_TANK]:
-            for participant in rsvp_msg['participants']:
-                if participant['user'] != payload.user_id: continue
-                userStatus = participant['status']
-                db.update_one({'_id': payload.message_id}, {
-                    'participants': utility.field_pull(
-                        db.find_one({'_id': payload.message_id})['participants'],
-                        ['user', payload.user_id],
-                        _dict=True
-                    )
-                })
-                break
-
-            user_doc = user_db.find_one({'_id': payload.user_id})
-            alias = None if not user_doc else user_doc['alias']
-            db.update_one({'_id': payload.message_id}, {
-                'participants': utility.field_push(
-                    db.find_one({'_id': payload.message_id})['participants'],
-                    {
-                        'user': payload.user_id,
-                        'alias': alias,
-                        'role': self.EMOJI_MAPPING[emoji],
-                        'status': 'confirmed' if not userStatus else userStatus
-                    }
-                )
-            })
-
-            await self._rsvp_embed(self.bot, payload.guild_id, rsvp=payload.message_id)
-
-        elif emoji in [constants.EMOJI_LATE, constants.EMOJI_TENTATIVE]:
-            for participant in rsvp_msg['participants']:
-                if participant['user'] != payload.user_id: continue
-
-                status = 'confirmed' if self.EMOJI_MAPPING[emoji] == participant['status'] else self.EMOJI_MAPPING[emoji]
-
-                db.update_one({'_id': payload.message_id}, {
-                    'participants': utility.field_pull(
-                        db.find_one({'_id': payload.message_id})['participants'],
-                        ['user', payload.user_id],
-                        _dict=True
-                    )
-                })
+            def signup():
+                userStatus = None
+                for participant in rsvp_msg['participants']:
+                    if participant['user'] != payload.user_id: continue
+                    userStatus = participant['status']
+                    db.update_one({'_id': payload.message_id}, {
+                        'participants': utility.field_pull(
+                            db.find_one({'_id': payload.message_id})['participants'],
+                            ['user', payload.user_id],
+                            _dict=True
+                        )
+                    })
+                    break
 
+                user_doc = user_db.find_one({'_id': payload.user_id})
+                alias = None if not user_doc else user_doc['alias']
                 db.update_one({'_id': payload.message_id}, {
                     'participants': utility.field_push(
                         db.find_one({'_id': payload.message_id})['participants'],
                         {
                             'user': payload.user_id,
-                            'alias': participant['alias'],
-                            'role': participant['role'],
-                            'status': status
+                            'alias': alias,
+                            'role': self.EMOJI_MAPPING[emoji],
+                            'status': 'confirmed' if not userStatus else userStatus
                         }
                     )
                 })
 
+            await storage.run(signup, guild=payload.guild_id)
+            await self._rsvp_embed(self.bot, payload.guild_id, rsvp=payload.message_id)
+
+        elif emoji in [constants.EMOJI_LATE, constants.EMOJI_TENTATIVE]:
+            def set_status():
+                for participant in rsvp_msg['participants']:
+                    if participant['user'] != payload.user_id: continue
+
+                    status = 'confirmed' if self.EMOJI_MAPPING[emoji] == participant['status'] else self.EMOJI_MAPPING[emoji]
+
+                    db.update_one({'_id': payload.message_id}, {
+                        'participants': utility.field_pull(
+                            db.find_one({'_id': payload.message_id})['participants'],
+                            ['user', payload.user_id],
+                            _dict=True
+                        )
+                    })
+
+                    db.update_one({'_id': payload.message_id}, {
+                        'participants': utility.field_push(
+                            db.find_one({'_id': payload.message_id})['participants'],
+                            {
+                                'user': payload.user_id,
+                                'alias': participant['alias'],
+                                'role': participant['role'],
+                                'status': status
+                            }
+                        )
+                    })
+
+            await storage.run(set_status, guild=payload.guild_id)
             await self._rsvp_embed(self.bot, payload.guild_id, rsvp=payload.message_id)
 
         elif emoji == constants.EMOJI_CANCEL:
             if payload.user_id in [x['user'] for x in rsvp_msg['participants']]:
-                db.update_one({'_id': payload.message_id}, {
-                    'participants': utility.field_pull(
-                        db.find_one({'_id': payload.message_id})['participants'],
-                        ['user', payload.user_id],
-                        _dict=True
-                    )
-                })
+                def withdraw():
+                    db.update_one({'_id': payload.message_id}, {
+                        'participants': utility.field_pull(
+                            db.find_one({'_id': payload.message_id})['participants'],
+                            ['user', payload.user_id],
+                            _dict=True
+                        )
+                    })
+                    stats.record_withdrawal(rsvp_msg, payload.user_id)
 
+                await storage.run(withdraw, guild=payload.guild_id)
                 await self._rsvp_embed(self.bot, payload.guild_id, rsvp=payload.message_id)
 
-        await message.remove_reaction(payload.emoji, payload.member)
+        message = self.bot.get_channel(payload.channel_id).get_partial_message(payload.message_id)
+        self.sender.defer_remove(message, payload.emoji, payload.member, self.REACT_EMOJI)
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
@@ -776,13 +1303,20 @@ class Main(commands.Cog, name='RSVP Bot'):
             await ctx.send(f':x: {ctx.author.mention} You do not have permission to run that command. See `{ctx.prefix}help` for commands you have access to')
 
 def setup(bot):
-    bot.add_cog(Main(bot))
+    handoff = getattr(bot, 'rsvp_handoff', None) or {} # State left by the cogs of a reloaded module
+    storage.migrate()
+    sender = handoff.get('sender') or outbound.Outbound(bot)
+    if constants.DIAGNOSTICS and not diagnostics.watchdog:
+        diagnostics.start(bot.loop, constants.LAG_THRESHOLD, constants.DIAGNOSTICS_TOP)
+
+    bot.add_cog(Main(bot, sender, handoff))
     logging.info('[Extension] Main module loaded')
-    bot.add_cog(Background(bot))
+    bot.add_cog(Background(bot, sender, handoff))
     logging.info('[Extension] Background task module loaded')
+    bot.rsvp_handoff = None
 
 def teardown(bot):
-    bot.remove_cog('Main')
+    bot.remove_cog('RSVP Bot')
     logging.info('[Extension] Main module unloaded')
     bot.remove_cog('Background')
     logging.info('[Extension] Background task module unloaded')
@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import logging
+
+import discord
+
+# Priority classes, lower is sent first
+REMINDER = 0
+EDIT = 1
+SEED = 2
+CLEANUP = 3
+
+# Routes of a channel, each a separate Discord rate limit bucket with its own queue
+MESSAGES = 'messages' # Sending and editing messages
+REACTIONS = 'reactions' # Adding, removing and clearing reactions
+
+SWEEP_INTERVAL = 2.0 # Seconds between reaction cleanup sweeps
+
+class Outbound:
+    """
+    Schedules outbound REST calls per rate-limit bucket (a channel's messages or its reactions), sending
+    user-visible work such as reminders and embed edits ahead of reaction seeding and cleanup. Messages
+    and reactions are queued separately, so a reminder never waits behind reaction traffic.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.queues = {}
+        self.workers = {}
+        self.cleanup = {}
+        self.sweeping = {}
+        self._cleaning = set()
+        self._order = itertools.count()
+        self._sweeper = bot.loop.create_task(self._sweep_loop())
+
+    def submit(self, channel, route, priority, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) in the bucket of a channel's route. Returns a future resolving to the call's result.
+        """
+        bucket = (channel, route)
+        future = self.bot.loop.create_future()
+        queue = self.queues.get(bucket)
+        if queue is None:
+            queue = self.queues[bucket] = asyncio.PriorityQueue()
+
+        queue.put_nowait((priority, next(self._order), func, args, kwargs, future))
+        if bucket not in self.workers or self.workers[bucket].done():
+            self.workers[bucket] = self.bot.loop.create_task(self._worker(bucket))
+
+        return future
+
+    def defer_remove(self, message, emoji, member, reseed):
+        """
+        Defer removal of a member's reaction until the next sweep. Reseed is the list of
+        emoji the bot seeded the message with, used if the sweep clears reactions in bulk.
+        """
+        pending = self.cleanup.setdefault(message.id, {'message': message, 'reseed': reseed, 'reactions': {}})
+        pending['reactions'][(str(emoji), member.id)] = (emoji, member)
+
+    def discard(self, message_id):
+        """
+        Drop deferred cleanup for a message, i.e. after it has been locked or canceled.
+        """
+        self.cleanup.pop(message_id, None)
+        if message_id in self.sweeping:
+            self.sweeping[message_id]['discarded'] = True
+
+    def close(self):
+        self._sweeper.cancel()
+        for task in list(self._cleaning) + list(self.workers.values()):
+            task.cancel()
+
+    async def _worker(self, bucket):
+        queue = self.queues[bucket]
+        while not queue.empty():
+            priority, order, func, args, kwargs, future = queue.get_nowait()
+            if future.cancelled():
+                continue
+
+            try:
+                result = await func(*args, **kwargs)
+
+            except Exception as e:
+                if not future.cancelled(): future.set_exception(e)
+
+            else:
+                if not future.cancelled(): future.set_result(result)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            pending, self.cleanup = self.cleanup, {}
+            for message_id, entry in pending.items():
+                self.sweeping[message_id] = entry
+                task = self.bot.loop.create_task(self._clean_message(entry))
+                self._cleaning.add(task)
+                task.add_done_callback(self._cleaning.discard)
+                task.add_done_callback(self._log_cleanup_error)
+
+    async def _clean_message(self, entry):
+        """
+        Queue the cleanup of a message's reactions, one call per queue item so reminders, edits
+        and seeding of new reservations in the channel can go ahead between them.
+        """
+        message = entry['message']
+        channel = message.channel.id
+        try:
+            if len(entry['reactions']) > len(entry['reseed']) + 2 and await self.submit(channel, REACTIONS, CLEANUP, self._only_pending, message, entry):
+                # Cheaper to clear everything and reseed in the original order
+                if await self.submit(channel, REACTIONS, CLEANUP, self._unless_discarded, entry, message.clear_reactions):
+                    for emoji in entry['reseed']:
+                        await self.submit(channel, REACTIONS, SEED, self._unless_discarded, entry, message.add_reaction, emoji)
+
+                return
+
+            await asyncio.gather(*[self.submit(channel, REACTIONS, CLEANUP, self._remove, entry, emoji, member) for emoji, member in entry['reactions'].values()])
+
+        finally:
+            if self.sweeping.get(message.id) is entry:
+                del self.sweeping[message.id]
+
+    @staticmethod
+    async def _unless_discarded(entry, func, *args):
+        """
+        Call func(*args) unless the message was locked or canceled since its cleanup was queued. Returns whether it was called.
+        """
+        if entry.get('discarded'):
+            return False
+
+        await func(*args)
+        return True
+
+    @classmethod
+    async def _remove(cls, entry, emoji, member):
+        try:
+            await cls._unless_discarded(entry, entry['message'].remove_reaction, emoji, member)
+
+        except discord.NotFound:
+            pass # Already removed or message deleted
+
+    @staticmethod
+    async def _only_pending(message, entry):
+        """
+        Check whether every reaction on a message is either a seed reaction of the bot or one queued for removal,
+        so clearing them in bulk removes nothing that would otherwise have stayed.
+        """
+        try:
+            message = await message.fetch()
+
+        except discord.HTTPException:
+            return False
+
+        pending = {}
+        for emoji, member_id in entry['reactions']:
+            pending[emoji] = pending.get(emoji, 0) + 1
+
+        for reaction in message.reactions:
+            emoji = str(reaction.emoji)
+            if emoji not in entry['reseed'] or reaction.count != pending.get(emoji, 0) + (1 if reaction.me else 0):
+                return False
+
+        return True
+
+    @staticmethod
+    def _log_cleanup_error(future):
+        if future.cancelled() or not future.exception():
+            return
+
+        logging.error(f'[Outbound] Unable to clean up reservation reactions. Error from Discord: {future.exception()}')
@@ -0,0 +1,137 @@
+import pendulum
+
+from modules import stats, storage
+
+FLAGS = { # Reservation flag committed when each action is stored
+    'notify': 'admin_reminder',
+    'remind': 'user_reminder'
+}
+HISTORY_LIMIT = 50 # Recent channel messages checked for a delivery interrupted by a restart or failure
+RETRY_WINDOWS = { # Seconds after the event starts, or after being stored if later, that a failing delivery is retried
+    'notify': 900,
+    'remind': 900,
+    'lock': 60 * 60 * 24
+}
+RETRY_DELAY = 60 # Seconds before retrying a failed delivery, doubled after each failure
+MAX_RETRY_DELAY = 900
+
+def _save(box, docs, changed, existing):
+    """
+    Write the changed outbox documents of guilds sharing a database file, with one write for the guilds in existing,
+    whose document is already stored, and one for the rest.
+    """
+    if changed & existing:
+        box.update_by_ids(changed & existing, lambda doc: doc.update(entries=docs[doc['_id']]['entries']))
+
+    if changed - existing:
+        box.insert_many([docs[x] for x in changed - existing])
+
+def enqueue(actions):
+    """
+    Store notify, remind and lock actions in the outbox, keyed by their idempotency key, and commit the reservation
+    state they change. Each guild's outbox is a single document, and guilds sharing a database file are written
+    together, so a file takes one write for its entries and one per kind of flag, however many actions there are.
+    Actions for reservations that are no longer active, or that are already flagged, are dropped. Returns the keys
+    of the entries stored by this call.
+    """
+    guilds = {}
+    for action in actions:
+        guilds.setdefault(action['guild'], []).append(action)
+
+    stored = []
+    locked = []
+    now = pendulum.now('UTC').int_timestamp
+    for db, group in storage.grouped('reservations', guilds):
+        box = storage.outbox(group[0])
+        group_actions = [x for guild in group for x in guilds[guild]]
+        rsvps = {x['_id']: x for x in db.find_by_ids(set(x['rsvp'] for x in group_actions)) if x['active']}
+        docs = {x['_id']: x for x in box.find_by_ids(group)}
+        existing = set(docs)
+
+        changed = set()
+        flagged = {}
+        for action in group_actions:
+            rsvp = rsvps.get(action['rsvp'])
+            if not rsvp or (action['action'] in FLAGS and rsvp[FLAGS[action['action']]]):
+                continue
+
+            doc = docs.setdefault(action['guild'], {'_id': action['guild'], 'guild': action['guild'], 'entries': {}})
+            if action['key'] not in doc['entries']: # Already stored if a previous attempt stopped before committing flags
+                doc['entries'][action['key']] = {
+                    'action': action,
+                    'created_at': now,
+                    'attempts': 0,
+                    'next_attempt': now,
+                    'expires': max(rsvp['date'], now) + RETRY_WINDOWS[action['action']]
+                }
+                changed.add(action['guild'])
+                stored.append(action['key'])
+
+            flagged.setdefault(action['action'], {})[rsvp['_id']] = rsvp
+
+        _save(box, docs, changed, existing)
+        for name, flagged_rsvps in flagged.items():
+            if name == 'lock':
+                for rsvp in flagged_rsvps.values():
+                    storage.untrack_reservation(rsvp['guild'], rsvp['_id'])
+                    if not rsvp.get('counted'):
+                        locked.append(rsvp)
+
+                db.update_by_ids(flagged_rsvps, {'active': False, 'counted': True})
+
+            else:
+                db.update_by_ids(flagged_rsvps, {FLAGS[name]: True})
+
+    if locked:
+        stats.record_locked(locked)
+
+    return stored
+
+def pending(local=None):
+    """
+    Return every outbox entry due to be delivered, oldest first, optionally only for guilds where local(guild) is true.
+    Entries waiting to be retried after a failure are left out until their next attempt.
+    """
+    entries = []
+    now = pendulum.now('UTC').int_timestamp
+    for box in storage.partitions('outbox', local):
+        for doc in box.find({}):
+            if local and not local(doc['guild']): continue
+            entries.extend(dict(entry, _id=key, guild=doc['guild']) for key, entry in doc['entries'].items() if entry['next_attempt'] <= now)
+
+    return sorted(entries, key=lambda x: x['created_at'])
+
+def finish(entries, failed):
+    """
+    Record the outcome of a delivery pass, with one write per database file. Failed is the set of keys of entries that
+    could not be delivered, and the other entries are removed. Failed entries are retried with a growing delay until
+    their retry window has passed, when they are dropped instead, so a Discord outage delays deliveries rather than
+    losing them. Returns the entries that were dropped.
+    """
+    guilds = {}
+    for entry in entries:
+        guilds.setdefault(entry['guild'], ([], []))[entry['_id'] in failed].append(entry['_id'])
+
+    dropped = []
+    now = pendulum.now('UTC').int_timestamp
+    for box, group in storage.grouped('outbox', guilds):
+        docs = {x['_id']: x for x in box.find_by_ids(group)}
+        for guild in docs:
+            done, retry = guilds[guild]
+            stored = docs[guild]['entries']
+            for key in done:
+                stored.pop(key, None)
+
+            for key in retry:
+                if key not in stored: continue
+                entry = stored[key]
+                entry['attempts'] += 1
+                if now >= entry['expires']:
+                    dropped.append(dict(stored.pop(key), _id=key, guild=guild))
+
+                else:
+                    entry['next_attempt'] = min(now + min(RETRY_DELAY * 2 ** (entry['attempts'] - 1), MAX_RETRY_DELAY), entry['expires'])
+
+        _save(box, docs, set(docs), set(docs))
+
+    return dropped
@@ -0,0 +1,150 @@
+import asyncio
+
+import pendulum
+
+import constants
+from modules import storage, utility
+
+ADMIN_ALERT = 7200 # Seconds before the start to alert admins of a low player count
+USER_REMINDER = 900 # Seconds before the start to remind participants
+FREQUENCIES = { # Seconds between runs, and how far after a run its event starts
+    'daily': (60 * 60 * 24, 60 * 60 * 24),
+    'weekly': (60 * 60 * 24 * 7, 60 * 60 * 24 * 7),
+    'biweekly': (60 * 60 * 24 * 14, 60 * 60 * 24 * 7) # Run every 2 weeks, making a rsvp the next week
+}
+
+def reservation_actions(rsvp, config):
+    """
+    Return the notify, remind and lock actions due for an active reservation. Actions are plain dicts so they
+    can be executed in process or sent to the gateway process by the scheduler worker. Once an event has started,
+    alerts and reminders missed while the bot was down are no longer useful, so only the lock is returned.
+    """
+    actions = []
+    start_date = pendulum.from_timestamp(rsvp['date'], tz=utility.timezone_alias(rsvp['timezone']))
+    current_date = pendulum.now(utility.timezone_alias(rsvp['timezone']))
+
+    date_diff = start_date - current_date
+    human_diff = current_date.add(seconds=date_diff.in_seconds()).diff_for_humans()
+    if date_diff.in_seconds() <= 0:
+        return [{
+            'action': 'lock',
+            'key': f'{rsvp["_id"]}:lock',
+            'guild': rsvp['guild'],
+            'rsvp': rsvp['_id'],
+            'channel': rsvp['channel']
+        }]
+
+    if date_diff.in_seconds() <= ADMIN_ALERT and not rsvp['admin_reminder']: # 2 hours prior, and first notification
+        participant_count = len(rsvp["participants"])
+        tanks = 0
+        healers = 0
+        dps = 0
+
+        for user in rsvp['participants']:
+            if user['role'] == 'tank':
+                tanks += 1
+
+            elif user['role'] == 'healer':
+                healers += 1
+
+            elif user['role'] == 'dps':
+                dps += 1
+
+        if tanks < constants.TANK_COUNT or healers < constants.HEALER_COUNT or dps < constants.DPS_COUNT or participant_count < constants.TOTAL_COUNT:
+            alert_roles = []
+            for x in config['access_roles']:
+                alert_roles.append(f'<@&{x}>')
+
+            role_mentions = ' '.join(alert_roles)
+            actions.append({
+                'action': 'notify',
+                'key': f'{rsvp["_id"]}:notify',
+                'guild': rsvp['guild'],
+                'rsvp': rsvp['_id'],
+                'channel': config['admin_channel'],
+                'content': f'{role_mentions} Raid event notification: scheduled raid {human_diff} has less members than minimum threshold for an event.\n' \
+                           f':man_raising_hand: **{participant_count}** user{utility.plural(participant_count)} {"is" if participant_count == 1 else "are"} signed up. Of these there are ' \
+                           f'**{tanks}** {constants.EMOJI_TANK}tank{utility.plural(tanks)}, **{healers}** {constants.EMOJI_HEALER}healer{utility.plural(healers)}, and **{dps}** {constants.EMOJI_DPS}dps.'
+            })
+
+    if date_diff.in_seconds() <= USER_REMINDER and not rsvp['user_reminder']: # 15 minutes prior, and first notification
+        users = [f'<@!{u["user"]}>' for u in rsvp['participants']]
+        actions.append({
+            'action': 'remind',
+            'key': f'{rsvp["_id"]}:remind',
+            'guild': rsvp['guild'],
+            'rsvp': rsvp['_id'],
+            'channel': config['rsvp_channel'],
+            'content': f':bellhop: Event starting soon! {config["invite_message"]}\n\n{", ".join(users)}'
+        })
+
+    return actions
+
+def recurring_actions(rule):
+    """
+    Return the post action due for a recurring rule, if any. Runs missed while the bot was down are skipped
+    over in one step: only the latest missed run is posted, and only if its event has not already started.
+    A post action without a day just advances the rule to its next future run.
+    """
+    now = pendulum.now(tz=utility.timezone_alias(rule['timezone'])).int_timestamp
+    if now < rule['next_run']:
+        return []
+
+    interval, offset = FREQUENCIES[rule['freq']]
+    missed = (now - rule['next_run']) // interval # Runs due before the latest one
+    latest_run = rule['next_run'] + missed * interval
+    return [{
+        'action': 'post',
+        'key': f'{rule["_id"]}:{rule["next_run"]}:post',
+        'guild': rule['guild'],
+        'rule': rule['_id'],
+        'run': rule['next_run'],
+        'day': latest_run + offset if latest_run + offset > now else None,
+        'next_run': latest_run + interval
+    }]
+
+def due_reservations(local=None):
+    """
+    Yield the actions due for every active reservation, optionally only for guilds where local(guild) is true.
+    """
+    configs = {}
+    for db in storage.partitions('reservations', local):
+        for rsvp in db.find({'active': True}):
+            if local and not local(rsvp['guild']): continue
+            if rsvp['guild'] not in configs:
+                configs[rsvp['guild']] = storage.mclient.rsvpbot.config.find_one({'_id': rsvp['guild']})
+
+            if not configs[rsvp['guild']]: continue # Guild config removed
+            yield from reservation_actions(rsvp, configs[rsvp['guild']])
+
+def due_recurring(local=None):
+    """
+    Yield the actions due for every recurring rule, optionally only for guilds where local(guild) is true.
+    """
+    for db in storage.partitions('recurring', local):
+        for rule in db.find({}):
+            if local and not local(rule['guild']): continue
+            yield from recurring_actions(rule)
+
+async def run_grouped(actions, execute, concurrency):
+    """
+    Execute actions with at most concurrency reservations or rules handled at once. Actions for the same
+    reservation or rule run in order. Returns a list of (action, exception) for actions that failed.
+    """
+    groups = {}
+    for action in actions:
+        groups.setdefault(action.get('rsvp', action.get('rule')), []).append(action)
+
+    failures = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async def run_group(group):
+        async with semaphore:
+            for action in group:
+                try:
+                    await execute(action)
+
+                except Exception as e:
+                    failures.append((action, e))
+
+    await asyncio.gather(*[run_group(x) for x in groups.values()])
+    return failures
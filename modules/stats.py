@@ -0,0 +1,125 @@
+import logging
+
+import pendulum
+
+from modules import storage, utility
+
+BACKFILL_CHUNK = 100 # Reservations counted per storage call, letting other storage work run in between
+NO_SHOW_WINDOW = 7200 # Withdrawing this many seconds or less before the start counts as a no-show
+MAX_FIELDS = ['last_event']
+
+def _merge(into, delta):
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            _merge(into.setdefault(key, {}), value)
+
+        elif key in MAX_FIELDS:
+            into[key] = max(into.get(key) or 0, value)
+
+        else:
+            into[key] = into.get(key, 0) + value
+
+    return into
+
+def _member(delta, member):
+    return delta.setdefault('members', {}).setdefault(str(member), {}) # JSON object keys are strings
+
+def _locked_deltas(rsvp):
+    month = pendulum.from_timestamp(rsvp['date'], tz=utility.timezone_alias(rsvp['timezone'])).format('YYYY-MM')
+    delta = {'events': 1, 'signups': len(rsvp['participants']), 'roles': {}, 'months': {month: {'events': 1}}}
+
+    for participant in rsvp['participants']:
+        _merge(delta, {'roles': {participant['role']: 1}, 'months': {month: {participant['role']: 1}}})
+        _merge(_member(delta, participant['user']), {
+            'signups': 1,
+            'roles': {participant['role']: 1},
+            'statuses': {participant['status']: 1},
+            'last_event': rsvp['date']
+        })
+
+    _merge(_member(delta, rsvp['host']), {'hosted': 1})
+    return delta
+
+def _canceled_deltas(rsvp):
+    delta = {'canceled': 1}
+    for participant in rsvp['participants']:
+        _member(delta, participant['user'])['canceled'] = 1
+
+    return delta
+
+def _commit(deltas):
+    """
+    Apply counter deltas, keyed by guild, to each guild's aggregate document, which holds the guild's counters and
+    a members sub-document keyed by user id. Guilds sharing a database file are written together, so any number
+    of changes costs one read and one write per file.
+    """
+    for db, guilds in storage.grouped('stats', deltas):
+        existing = set(x['_id'] for x in db.find_by_ids(guilds))
+        if existing:
+            db.update_by_ids(existing, lambda doc: _merge(doc, deltas[doc['_id']]))
+
+        new = [_merge({'_id': x, 'guild': x}, deltas[x]) for x in guilds if x not in existing]
+        if new:
+            db.insert_many(new)
+
+def record_locked(rsvps):
+    """
+    Count reservations that have started and locked in.
+    """
+    deltas = {}
+    for rsvp in rsvps:
+        _merge(deltas.setdefault(rsvp['guild'], {}), _locked_deltas(rsvp))
+
+    _commit(deltas)
+
+def record_canceled(rsvp):
+    """
+    Count a reservation that was canceled by an admin or had its message deleted.
+    """
+    _commit({rsvp['guild']: _canceled_deltas(rsvp)})
+
+def record_withdrawal(rsvp, member):
+    """
+    Count a member removing themselves from a reservation, and a no-show if it was close to the start.
+    """
+    delta = {'withdrawn': 1}
+    if rsvp['date'] - pendulum.now('UTC').int_timestamp <= NO_SHOW_WINDOW:
+        delta['no_shows'] = 1
+
+    _commit({rsvp['guild']: {'members': {str(member): delta}}})
+
+def guild_stats(guild):
+    return storage.stats(guild).find_one({'_id': guild})
+
+def member_stats(guild, member):
+    doc = guild_stats(guild)
+    return None if not doc else doc.get('members', {}).get(str(member))
+
+async def backfill(guild):
+    """
+    Count every finished reservation of a guild that predates the aggregates. Reservations are processed in
+    chunks, each in its own storage call, and are flagged so they are never counted twice.
+    Returns the number of reservations counted.
+    """
+    db = storage.reservations(guild)
+    now = pendulum.now('UTC').int_timestamp
+
+    def flush(chunk):
+        delta = {}
+        for rsvp in chunk:
+            if rsvp.get('canceled') or rsvp['date'] > now: # Inactive before its start date, so it was canceled
+                _merge(delta, _canceled_deltas(rsvp))
+
+            else:
+                _merge(delta, _locked_deltas(rsvp))
+
+        _commit({guild: delta})
+        db.update_many({'_id': {'$in': [x['_id'] for x in chunk]}}, {'$set': {'counted': True}})
+
+    pending = [x for x in await storage.run(db.find, {'guild': guild, 'active': False}) if not x.get('counted')]
+    for i in range(0, len(pending), BACKFILL_CHUNK):
+        await storage.run(flush, pending[i:i + BACKFILL_CHUNK], guild=guild)
+
+    await storage.run(_commit, {guild: {'backfilled': 1}}, guild=guild)
+    logging.info(f'[Stats] Backfilled {len(pending)} reservation(s) for guild {guild}')
+    return len(pending)
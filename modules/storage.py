@@ -0,0 +1,310 @@
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import os
+
+from tinydb import where
+from tinymongo import TinyMongoClient
+from tinymongo.tinymongo import DuplicateKeyError, generate_id
+
+import constants
+from modules import utility # Fills in settings missing from older constants files
+
+try:
+    import fcntl
+
+except ImportError: # Windows, only a single bot process is supported
+    fcntl = None
+
+FOLDER = 'tinydb'
+
+@contextlib.contextmanager
+def _file_lock(database):
+    """
+    Hold an exclusive lock on a database file, shared by every process using the same tinydb folder.
+    """
+    if not fcntl:
+        yield
+        return
+
+    with open(os.path.join(FOLDER, f'{database}.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _find_by_ids(collection, ids):
+    """
+    Find the documents with any of the given ids using a single condition. tinymongo turns an $in query into
+    one nested condition per id, which overflows the recursion limit once there are a few hundred.
+    """
+    if collection.table is None:
+        collection.build_table()
+
+    return collection.table.search(where('_id').one_of(set(ids)))
+
+def _update_by_ids(collection, ids, fields):
+    """
+    Update the documents with any of the given ids with a single write. Fields is either a dict of fields set
+    on every document, or a function changing each document in place.
+    """
+    if collection.table is None:
+        collection.build_table()
+
+    collection.table.update(fields, where('_id').one_of(set(ids)))
+
+def _insert_many(collection, docs):
+    """
+    Insert documents with a single write. tinymongo inserts them one at a time, rewriting the database file for each.
+    """
+    if collection.table is None:
+        collection.build_table()
+
+    for doc in docs:
+        doc['_id'] = doc.get('_id') or generate_id()
+
+    ids = [x['_id'] for x in docs]
+    duplicates = _find_by_ids(collection, ids)
+    if duplicates or len(set(ids)) < len(ids):
+        raise DuplicateKeyError(f'_id:{duplicates[0]["_id"] if duplicates else ids} already exists in collection:{collection.tablename}')
+
+    collection.table.insert_multiple(docs)
+
+def _delete_many(collection, query):
+    """
+    Delete matching documents with a single write. tinymongo removes them one at a time, rewriting the database file for each.
+    """
+    if collection.table is None:
+        collection.build_table()
+
+    if collection.find_one(query):
+        collection.table.remove(collection.parse_query(query))
+
+class LockedCollection:
+    """
+    A collection whose every operation runs under its database's file lock. The database is reopened
+    inside the lock so reads always see writes made by other processes.
+    """
+    def __init__(self, client, database, name):
+        self._client = client
+        self._database = database
+        self._name = name
+
+    def __getattr__(self, attr):
+        def locked(*args, **kwargs):
+            with _file_lock(self._database):
+                collection = getattr(self._client[self._database], self._name)
+                method = attr
+                if attr == 'update_many' and not hasattr(type(collection), 'update_many'):
+                    method = 'update' # Older tinymongo releases apply update to every match
+
+                if attr == 'find_by_ids':
+                    return _find_by_ids(collection, *args, **kwargs)
+
+                if attr == 'update_by_ids':
+                    return _update_by_ids(collection, *args, **kwargs)
+
+                if attr == 'insert_many':
+                    return _insert_many(collection, *args, **kwargs)
+
+                if attr == 'delete_many':
+                    return _delete_many(collection, *args, **kwargs)
+
+                result = getattr(collection, method)(*args, **kwargs)
+                if attr == 'find':
+                    result = list(result) # Read everything while the lock is held
+
+                return result
+
+        locked.database = self._database # Lets run pick this file's lane
+        return locked
+
+class LockedDatabase:
+    def __init__(self, client, database):
+        self._client = client
+        self._database = database
+
+    def __getattr__(self, name):
+        return LockedCollection(self._client, self._database, name)
+
+    __getitem__ = __getattr__
+
+class LockedClient:
+    def __init__(self, folder):
+        self._client = TinyMongoClient(folder)
+
+    def __getattr__(self, database):
+        return LockedDatabase(self._client, database)
+
+    __getitem__ = __getattr__
+
+mclient = LockedClient(FOLDER)
+
+THREADS = 8 # Storage calls made by the bot run on these threads instead of the event loop
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='storage')
+_lanes = {} # Lane name to the lock its calls wait on, one lane per database file
+
+def database(guild=None):
+    """
+    Return the name of the database file holding a guild's partitioned collections. This is the shared
+    rsvpbot file when storage is not partitioned, or when no guild is given.
+    """
+    return f'guild_{guild}' if partitioned() and guild is not None else 'rsvpbot'
+
+async def run(func, *args, guild=None, lane=None):
+    """
+    Run a storage call, or a function making several, on a storage thread so waiting for another process's file
+    lock or a database rewrite never blocks the event loop. Each database file has its own lane whose calls run
+    one at a time in the order they were made, so a function doing a read followed by a write is never interleaved
+    with other storage work on the same file from this process, while other files carry on in parallel.
+    Collection methods run in the lane of their database file. Other functions run in the lane of the given
+    guild's file, or of the one named by lane, i.e. for reads spanning every partition.
+    """
+    name = lane or getattr(func, 'database', None) or database(guild)
+    if name not in _lanes:
+        _lanes[name] = asyncio.Lock()
+
+    async with _lanes[name]: # Waiters are woken in the order they arrived
+        return await asyncio.get_event_loop().run_in_executor(_executor, functools.partial(func, *args))
+
+async def run_each(func, items, *args):
+    """
+    Run func(group, *args) for the items of each database file, where items are dicts with a guild, in every
+    file's lane at once. Returns the combined results, which func returns as lists.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(database(item['guild']), []).append(item)
+
+    results = await asyncio.gather(*[run(func, group, *args, lane=name) for name, group in groups.items()])
+    return [x for result in results for x in result]
+
+PARTITIONED_COLLECTIONS = ['reservations', 'recurring', 'stats', 'outbox']
+
+_upcoming = {} # Guild id to a sorted list of (date, message id) for its active reservations
+
+def partitioned():
+    return constants.STORAGE_PARTITIONED
+
+def _collection(name, guild):
+    if not partitioned():
+        return getattr(mclient.rsvpbot, name)
+
+    return getattr(mclient[f'guild_{guild}'], name)
+
+def reservations(guild):
+    """
+    Return the reservations collection holding a guild's documents.
+    """
+    return _collection('reservations', guild)
+
+def recurring(guild):
+    """
+    Return the recurring rules collection holding a guild's documents.
+    """
+    return _collection('recurring', guild)
+
+def stats(guild):
+    """
+    Return the attendance aggregates collection holding a guild's documents.
+    """
+    return _collection('stats', guild)
+
+def outbox(guild):
+    """
+    Return the collection of a guild's notifications waiting to be delivered.
+    """
+    return _collection('outbox', guild)
+
+def partitions(name, local=None):
+    """
+    Yield every collection of a partitioned type, one per guild. When storage is not partitioned this is the single shared collection.
+    Local is an optional callable taking a guild id, used to skip partitions of guilds handled by other processes.
+    """
+    if not partitioned():
+        yield getattr(mclient.rsvpbot, name)
+        return
+
+    for config in mclient.rsvpbot.config.find({}):
+        if local and not local(config['_id']):
+            continue
+
+        yield _collection(name, config['_id'])
+
+def grouped(name, guilds):
+    """
+    Yield (collection, guilds) covering every given guild, once per database file, so changes for guilds
+    sharing a file can be written together. When storage is not partitioned this is a single pair.
+    """
+    guilds = list(guilds)
+    if not partitioned():
+        if guilds:
+            yield getattr(mclient.rsvpbot, name), guilds
+
+        return
+
+    for guild in guilds:
+        yield _collection(name, guild), [guild]
+
+def upcoming(guild, start, end=None):
+    """
+    Return (date, message id) of a guild's active reservations starting between two timestamps, in date order.
+    Served from a sorted per-guild index that is built with one scan on first use and kept up to date after.
+    """
+    if guild not in _upcoming:
+        _upcoming[guild] = sorted((x['date'], x['_id']) for x in reservations(guild).find({'guild': guild, 'active': True}))
+
+    entries = _upcoming[guild]
+    low = bisect.bisect_left(entries, (start, 0))
+    high = len(entries) if end is None else bisect.bisect_right(entries, (end, float('inf')))
+    return entries[low:high]
+
+def track_reservation(guild, date, message):
+    """
+    Add a new active reservation to the date index.
+    """
+    if guild in _upcoming:
+        bisect.insort(_upcoming[guild], (date, message))
+
+def untrack_reservation(guild, message):
+    """
+    Remove a reservation that is no longer active from the date index.
+    """
+    if guild in _upcoming:
+        _upcoming[guild] = [x for x in _upcoming[guild] if x[1] != message]
+
+def migrate():
+    """
+    Move documents from the shared collections into per-guild partitions when partitioning is enabled. Runs under
+    a lock so only one process migrates, and one guild at a time, so a pass interrupted part way is finished by
+    the next one without inserting any document twice.
+    """
+    if not partitioned():
+        return
+
+    with _file_lock('migrate'):
+        for name in PARTITIONED_COLLECTIONS:
+            legacy = getattr(mclient.rsvpbot, name)
+            guilds = {}
+            moved = 0
+            for doc in legacy.find({}):
+                guilds.setdefault(doc['guild'], []).append(doc)
+
+            for guild, docs in guilds.items():
+                partition = _collection(name, guild)
+                existing = set(x['_id'] for x in partition.find_by_ids([x['_id'] for x in docs]))
+                missing = [x for x in docs if x['_id'] not in existing]
+                if missing:
+                    partition.insert_many(missing)
+                    moved += len(missing)
+
+                legacy.delete_many({'guild': guild})
+
+            if guilds:
+                logging.info(f'[Storage] Moved {moved} {name} document(s) into {len(guilds)} guild partition(s)')
@@ -0,0 +1,161 @@
+"""
+Streaming export and import of a guild's reservations, recurring rules and aliases.
+
+Usable from the bot through the "rsvp export" and "rsvp import" commands, or from the
+command line while the bot is stopped:
+    python -m modules.transfer export 314857672585248768 --format csv --output guild.csv
+    python -m modules.transfer import guild.csv
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+
+from modules import storage
+
+CHUNK = 500 # Records written or inserted per batch
+CSV_FIELDS = ['type', '_id', 'guild', 'document']
+
+def _records(guild):
+    aliased = set()
+    for rsvp in storage.reservations(guild).find({'guild': guild}):
+        aliased.update(x['user'] for x in rsvp['participants'])
+        yield 'reservation', rsvp
+
+    for rule in storage.recurring(guild).find({'guild': guild}):
+        yield 'recurring', rule
+
+    aliased = list(aliased)
+    for i in range(0, len(aliased), CHUNK):
+        for user in storage.mclient.rsvpbot.users.find_by_ids(aliased[i:i + CHUNK]):
+            user['guild'] = guild
+            yield 'alias', user
+
+def export_lines(guild, fmt='jsonl'):
+    """
+    Yield a guild's data as lines of JSONL or CSV, one record per line.
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    for _type, doc in _records(guild):
+        if fmt == 'csv':
+            writer.writerow({'type': _type, '_id': doc['_id'], 'guild': doc['guild'], 'document': json.dumps(doc)})
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        else:
+            yield json.dumps({'type': _type, **doc}) + '\n'
+
+def _parse(lines, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(lines):
+            yield row['type'], json.loads(row['document'])
+
+    else:
+        for line in lines:
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            yield record.pop('type'), record
+
+def _insert(_type, guild, docs):
+    if _type == 'reservation':
+        db = storage.reservations(guild)
+
+    elif _type == 'recurring':
+        db = storage.recurring(guild)
+
+    else:
+        db = storage.mclient.rsvpbot.users
+        for doc in docs:
+            doc.pop('guild', None)
+
+    existing = set(x['_id'] for x in db.find_by_ids([x['_id'] for x in docs]))
+    docs = list({x['_id']: x for x in docs if x['_id'] not in existing}.values()) # A record repeated in the file is inserted once
+    if not docs:
+        return 0
+
+    db.insert_many(docs)
+    if _type == 'reservation':
+        for doc in docs:
+            if doc['active']: storage.track_reservation(guild, doc['date'], doc['_id'])
+
+    return len(docs)
+
+def import_lines(lines, fmt='jsonl', guild=None, accept=None):
+    """
+    Insert records from lines of JSONL or CSV in batches, skipping documents that already exist.
+    When a guild is given, records belonging to other guilds are ignored. Accept is an optional
+    callable taking a record's type and document, used to skip records the importer may not
+    write. Yields the running count of inserted documents after each batch so callers can yield
+    to the event loop.
+    """
+    batches = {}
+    inserted = 0
+    for _type, doc in _parse(lines, fmt):
+        if _type not in ['reservation', 'recurring', 'alias']:
+            raise ValueError(f'Unknown record type "{_type}"')
+
+        if guild is not None and doc['guild'] != guild:
+            continue
+
+        if accept and not accept(_type, doc):
+            continue
+
+        batch = batches.setdefault((_type, doc['guild']), [])
+        batch.append(doc)
+        if len(batch) >= CHUNK:
+            inserted += _insert(_type, doc['guild'], batch)
+            batch.clear()
+            yield inserted
+
+    for (_type, batch_guild), batch in batches.items():
+        if batch:
+            inserted += _insert(_type, batch_guild, batch)
+
+    yield inserted
+
+def main():
+    logging.basicConfig(format='%(levelname)s [%(asctime)s]: %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Export or import RSVP Bot guild data')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export a guild\'s reservations, recurring events and aliases')
+    export_parser.add_argument('guild', type=int)
+    export_parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    export_parser.add_argument('--output', help='File to write to, defaults to stdout')
+
+    import_parser = subparsers.add_parser('import', help='Import a file created by export')
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+    import_parser.add_argument('--guild', type=int, help='Only import records for this guild')
+
+    args = parser.parse_args()
+    if args.action == 'export':
+        output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            output.writelines(export_lines(args.guild, args.format))
+
+        finally:
+            if args.output: output.close()
+
+    else:
+        fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'jsonl')
+        with open(args.file, newline='', encoding='utf-8') as f:
+            for inserted in import_lines(f, fmt, args.guild):
+                pass
+
+        logging.info(f'[Transfer] Imported {inserted} document(s) from {args.file}')
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,22 @@ import discord
 import constants
 import exceptions
 
+SETTING_DEFAULTS = { # Settings added after the first release, used when a constants file copied from an older example lacks them
+    'STORAGE_PARTITIONED': False,
+    'SHARDING': False,
+    'SHARD_COUNT': None,
+    'SHARD_IDS': None,
+    'SCHEDULER_WORKER': False,
+    'SCHEDULER_SOCKET': 'rsvpbot.sock',
+    'DIAGNOSTICS': False,
+    'LAG_THRESHOLD': 0.5,
+    'DIAGNOSTICS_TOP': 10,
+    'CATCHUP_CONCURRENCY': 5
+}
+missing_settings = [x for x in SETTING_DEFAULTS if not hasattr(constants, x)]
+for setting in missing_settings:
+    setattr(constants, setting, SETTING_DEFAULTS[setting])
+
 def timezone_alias(tz):
     timezone = tz.lower()
     if timezone in constants.TIMEZONE_ALIASES:
@@ -12,6 +28,29 @@ def timezone_alias(tz):
 
     return tz
 
+def local_guild(bot, guild):
+    """
+    Return whether a guild belongs to one of the shards run by this process.
+    """
+    shard_ids = getattr(bot, 'shard_ids', None)
+    if not bot.shard_count or shard_ids is None:
+        return True
+
+    return (guild >> 22) % bot.shard_count in shard_ids
+
+def parse_shard_ids(value):
+    """
+    Parse shard ids given as a range (i.e. 0-3) or a comma separated list (i.e. 0,2,4). Lists and None are returned as is.
+    """
+    if not isinstance(value, str):
+        return value
+
+    if '-' in value:
+        start, end = value.split('-')
+        return list(range(int(start), int(end) + 1))
+
+    return [int(x.strip()) for x in value.split(',')]
+
 def field_push(field, new):
     """
     Return an updated array field with new data included. Does not take fields with duplicate entries.
@@ -0,0 +1,87 @@
+"""
+Out-of-process scheduler. Plans reminders, locks and recurring event posts from the store and
+sends them to the bot over SCHEDULER_SOCKET, keeping the bot's event loop free for Discord events.
+Requires SCHEDULER_WORKER = True in the constants file. Run alongside the bot, from the same directory:
+    python -m modules.worker
+With multiple bot processes, run one worker per process with the same shard arguments and socket:
+    python -m modules.worker --shard-count 8 --shards 0-3 --socket rsvpbot-0.sock
+"""
+import argparse
+import asyncio
+import functools
+import logging
+import sys
+import types
+
+import constants
+import exceptions
+from modules import ipc, scheduler, utility
+
+RESERVATION_INTERVAL = 60 # Seconds between reservation reminder and lock checks
+RECURRING_INTERVAL = 10 # Seconds between recurring event checks
+
+async def _send(client, actions):
+    """
+    Send a batch of actions to the bot, which executes them and delivers anything waiting in its outbox.
+    """
+    try:
+        await client.request({'action': 'batch', 'key': f'{len(actions)} action(s)', 'actions': actions})
+
+    except exceptions.IPCError as e:
+        logging.error(f'[Worker] Unable to send {len(actions)} action(s), they will be retried: {e}')
+
+async def _run(client, name, interval, planner, always=False):
+    while True:
+        actions = list(planner())
+        if actions or always: # Empty batches still let the bot retry its outbox
+            await _send(client, actions)
+
+        if actions:
+            logging.debug(f'[Worker] Sent {len(actions)} {name} action(s)')
+
+        await asyncio.sleep(interval)
+
+async def run(socket, local):
+    client = ipc.Client(socket)
+    await client.connect()
+
+    # Catch up on everything missed while the bot or worker was down in a single pass
+    actions = list(scheduler.due_reservations(local)) + list(scheduler.due_recurring(local))
+    if actions:
+        logging.info(f'[Worker] Catching up on {len(actions)} missed action(s)')
+
+    await _send(client, actions)
+    await asyncio.gather(
+        _run(client, 'reservation', RESERVATION_INTERVAL, functools.partial(scheduler.due_reservations, local), always=True),
+        _run(client, 'recurring', RECURRING_INTERVAL, functools.partial(scheduler.due_recurring, local))
+    )
+
+def main():
+    logging.basicConfig(format='%(levelname)s [%(asctime)s]: %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='RSVP Bot scheduler worker')
+    parser.add_argument('--shard-count', type=int, default=constants.SHARD_COUNT, help='Total number of shards across all bot processes')
+    parser.add_argument('--shards', default=constants.SHARD_IDS, help='Shard ids run by the bot process this worker serves')
+    parser.add_argument('--socket', default=constants.SCHEDULER_SOCKET, help='Socket path the bot process listens on')
+    args = parser.parse_args()
+
+    if not constants.SCHEDULER_WORKER:
+        logging.fatal('[Worker] SCHEDULER_WORKER is disabled, the bot runs its own scheduler')
+        logging.fatal('Set SCHEDULER_WORKER = True in constants.py, restart the bot and run again')
+        sys.exit(1)
+
+    try:
+        shard = types.SimpleNamespace(shard_count=args.shard_count, shard_ids=utility.parse_shard_ids(args.shards))
+
+    except ValueError:
+        logging.fatal(f'[Worker] Shard ids "{args.shards}" are invalid')
+        sys.exit(1)
+
+    logging.info('[Worker] Starting RSVP Bot scheduler worker')
+    try:
+        asyncio.get_event_loop().run_until_complete(run(args.socket, functools.partial(utility.local_guild, shard)))
+
+    except KeyboardInterrupt:
+        logging.info('[Worker] Keyboard interrupt detected, shutting down')
+
+if __name__ == '__main__':
+    main()